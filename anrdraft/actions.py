@@ -0,0 +1,413 @@
+"""
+Draft commands as state changes, with no Discord in them.
+
+Each action takes the id of the draft it acts on, applies its changes under that draft's lock
+and returns (reply, messages, delivery): the reply for whoever ran the command, or None, plus
+the messages draft operations produced and how the draft's packs are sent. The bot runs actions
+in process or, with shards, in whichever worker process owns the draft (see shards.py).
+"""
+
+import asyncio
+import functools
+
+from drafters import (
+    DEFAULT_STRATEGY, MAX_BOTS, STRATEGIES, add_bots, count_bots, pick_by_rating, play_bots
+)
+from drafts import (
+    DELIVERY_MODES, DRAFTS, PLAYER_REMOVED_HANDLERS, POOL_DIR, add_player,
+    begin_draft, cleanup, draft_started, encode_card, encode_draft,
+    encode_full_card, get_card, get_creator, get_draft_lock,
+    get_human_players, get_num_players, get_pick_time, get_picks, get_players,
+    handle_pick, open_new_pack, open_next_pack_or_wait, player_has_open_pack,
+    pool_problem, remove_player, set_delivery_mode, set_pick_time, setup_draft,
+    user_can_create_draft
+)
+from exports import export_files
+from pools import load_pool
+from timers import Scheduler
+
+# Pick timers can't be set shorter than this, in seconds.
+MIN_PICK_TIME = 10
+# Players are warned this long before their time to pick runs out, or a third of it if that's shorter.
+PICK_WARNING = 15
+
+# Pick deadlines for every draft, keyed by (player_id, 'warn') and (player_id, 'pick').
+TIMERS = Scheduler()
+# Set with use_deliver(): how messages from timers reach players, as deliver(messages, delivery).
+DELIVER = None
+# Rendered exports by player, as (number of picks, {format: files}). Stale once they pick again.
+EXPORTS = {}
+
+
+def use_deliver(deliver):
+    global DELIVER
+    DELIVER = deliver
+
+
+def get_delivery(draft_id):
+    return DRAFTS[draft_id]['metadata']['delivery']
+
+
+def is_member(draft_id, player_id):
+    # a draft can end, or a player leave, while a command for it waits its turn
+    return draft_id in DRAFTS and player_id in get_players(draft_id)
+
+
+# Pick Timers
+
+def start_pick_timers(draft_id, messages):
+    """
+    Gives everyone who is sent a pack in messages the draft's time limit to pick from it.
+    Call while holding the draft lock, after the operation that returned the messages.
+    """
+    # the draft may have just finished
+    if draft_id not in DRAFTS:
+        return
+    pick_time = get_pick_time(draft_id)
+    if pick_time is None:
+        return
+    for player_id, content, pack in messages:
+        if pack is not None:
+            start_pick_timer(draft_id, player_id, pick_time)
+
+
+def start_pick_timer(draft_id, player_id, pick_time):
+    warning = min(PICK_WARNING, pick_time / 3)
+    TIMERS.schedule((player_id, 'warn'), pick_time - warning, functools.partial(warn_pick_due, player_id, warning))
+    TIMERS.schedule((player_id, 'pick'), pick_time, functools.partial(auto_pick, draft_id, player_id))
+
+
+def stop_pick_timers(player_id):
+    TIMERS.cancel((player_id, 'warn'))
+    TIMERS.cancel((player_id, 'pick'))
+
+
+PLAYER_REMOVED_HANDLERS.append(stop_pick_timers)
+
+
+async def warn_pick_due(player_id, seconds):
+    await DELIVER([(
+        player_id,
+        'You have {seconds:.0f} seconds left to pick from this pack, then a card will be picked for you.'.format(seconds=seconds),
+        None
+    )], None)
+
+
+async def auto_pick(draft_id, player_id):
+    """Picks the best rated card for a player who ran out of time."""
+    async with get_draft_lock(draft_id):
+        if not is_member(draft_id, player_id):
+            return
+        # the limit may have been turned off since this timer was set
+        if get_pick_time(draft_id) is None or not player_has_open_pack(draft_id, player_id):
+            return
+        delivery = get_delivery(draft_id)
+        player = DRAFTS[draft_id]['players'][player_id]
+        card = handle_pick(draft_id, player_id, pick_by_rating(player, player['inbox'][0]))
+        stop_pick_timers(player_id)
+        messages = [(player_id, 'You ran out of time, so a card was picked for you.', None)]
+        messages.extend(play_bots(draft_id, open_next_pack_or_wait(draft_id, player_id, card)))
+        start_pick_timers(draft_id, messages)
+    await DELIVER(messages, delivery)
+
+
+def resume_drafts():
+    """
+    After a restart, players may never have received the pack they were picking from.
+    Returns (messages, delivery) for each draft resending those packs, and restarts their timers.
+    """
+    resumed = []
+    for draft_id in DRAFTS:
+        messages = []
+        for player_id in get_human_players(draft_id):
+            if player_has_open_pack(draft_id, player_id):
+                messages.append((player_id, 'The draft bot restarted. Here is the pack you were picking from.', None))
+                messages.append((player_id, None, tuple(DRAFTS[draft_id]['players'][player_id]['inbox'][0])))
+        if messages:
+            start_pick_timers(draft_id, messages)
+            resumed.append((messages, get_delivery(draft_id)))
+    return resumed
+
+
+# Actions
+
+async def create(user_name, user_id, pool=None, draft_id=None):
+    if pool is not None and load_pool(POOL_DIR, pool) is None:
+        msg = 'Card pool `{pool}` does not exist. Use `!pools` to see the available pools.'.format(pool=pool)
+    elif user_can_create_draft(user_id):
+        new_draft_code = setup_draft(user_name, user_id, pool, draft_id)
+        msg = ('Draft successfully created.\n'
+            'Your draft ID is `{draft_id}`.\n'
+            'Other players can use this code with the `!join {draft_id}` command to join the draft.').format(draft_id=new_draft_code)
+    else:
+        msg = ('You can only create one draft at a time, and not while you are in another.\n'
+            'You can use `!canceldraft` or `!leave` to quit and then start over.')
+    return msg, [], None
+
+
+async def describe(draft_id):
+    """The creator and whether the draft has started, or None if there is no such draft."""
+    if draft_id not in DRAFTS:
+        return None
+    return {
+        'creator': get_creator(draft_id),
+        'started': draft_started(draft_id)
+    }
+
+
+async def pick(draft_id, player_id, card_code):
+    async with get_draft_lock(draft_id):
+        if not is_member(draft_id, player_id):
+            return 'You are not in a draft.', [], None
+        if not player_has_open_pack(draft_id, player_id):
+            return 'You have no pack open. Your next one will be sent once it is passed to you.', [], None
+        delivery = get_delivery(draft_id)
+        card = handle_pick(draft_id, player_id, card_code)
+        if card is None:
+            return '`{code}` is not in your pack.'.format(code=card_code), [], None
+        stop_pick_timers(player_id)
+        messages = play_bots(draft_id, open_next_pack_or_wait(draft_id, player_id, card))
+        start_pick_timers(draft_id, messages)
+    return None, messages, delivery
+
+
+async def join(draft_id, player_id, player_name):
+    async with get_draft_lock(draft_id):
+        if draft_id not in DRAFTS:
+            return 'Draft does not exist.', [], None
+        if player_id in get_players(draft_id):
+            return 'You can not join the same draft more than once.', [], None
+        if draft_started(draft_id):
+            return 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id), [], None
+        add_player(player_name, player_id, draft_id)
+        creator_id, creator_name = get_creator(draft_id)
+        messages = [(
+            creator_id,
+            ('{player} has joined your draft (`{draft}`).\n'
+                'There are now {num} players registered.').format(player=player_name, draft=draft_id, num=get_num_players(draft_id)),
+            None
+        )]
+    msg = ('Successfully joined draft `{draft_id}`.\n'
+        'Please wait for `{creator}` to begin the draft.').format(
+            draft_id=draft_id,
+            creator=creator_name
+        )
+    return msg, messages, None
+
+
+async def start(draft_id, user_id):
+    async with get_draft_lock(draft_id):
+        if not is_member(draft_id, user_id):
+            return 'You are not enrolled in a draft.', [], None
+        creator_id, creator_name = get_creator(draft_id)
+        if user_id != creator_id:
+            return 'Only the draft creator can start the draft.', [], None
+        if draft_started(draft_id):
+            return 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id), [], None
+        # checked before anything changes, so the draft can still be fixed up and started
+        problem = pool_problem(draft_id)
+        if problem is not None:
+            return problem, [], None
+        begin_draft(draft_id)
+        messages = [
+            (player_id, 'Welcome to the draft! Here is your first pack. Good luck!', None)
+            for player_id in get_human_players(draft_id)
+        ]
+        messages.extend(play_bots(draft_id, open_new_pack(draft_id)))
+        start_pick_timers(draft_id, messages)
+        delivery = get_delivery(draft_id)
+    return 'Draft `{draft_id}` is starting!'.format(draft_id=draft_id), messages, delivery
+
+
+def cancel_messages(draft_id):
+    """Ends the draft and tells everyone left in it. Call while holding the draft lock."""
+    creator_id, creator_name = get_creator(draft_id)
+    player_ids = get_human_players(draft_id)
+    cleanup(draft_id)
+    content = 'Draft `{draft_id}` was cancelled by `{creator}`.'.format(
+        draft_id=draft_id,
+        creator=creator_name
+    )
+    return [(player_id, content, None) for player_id in player_ids]
+
+
+async def cancel(draft_id):
+    async with get_draft_lock(draft_id):
+        # it may have finished while the creator was confirming
+        if draft_id not in DRAFTS:
+            return None, [], None
+        return None, cancel_messages(draft_id), None
+
+
+async def leave(draft_id, player_id, player_name):
+    async with get_draft_lock(draft_id):
+        if not is_member(draft_id, player_id):
+            return 'You are not enrolled in a draft.', [], None
+        creator_id, creator_name = get_creator(draft_id)
+        # remove_player() does the checks I usually do here
+        res = remove_player(player_id, draft_id)
+        if res != 'ok':
+            return 'Failed to leave draft. Error: ' + res, [], None
+        if player_id == creator_id:
+            msg = ('Successfully withdrew from draft `{draft_id}`.\n'
+                'Because you were the creator of this draft it has been cancelled. \n'
+                'The other players have been notified.').format(draft_id=draft_id)
+            return msg, cancel_messages(draft_id), None
+        messages = [(
+            creator_id,
+            ('{player} has left your draft (`{draft}`).\n'
+                'There are now {num} players registered.').format(
+                    player=player_name,
+                    draft=draft_id,
+                    num=get_num_players(draft_id)
+                ),
+            None
+        )]
+    return 'Successfully withdrew from draft `{draft_id}`.'.format(draft_id=draft_id), messages, None
+
+
+def creator_check(draft_id, player_id, what):
+    """The reply refusing a creator-only command, or None if player_id may run it."""
+    if not is_member(draft_id, player_id):
+        return 'You are not enrolled in a draft.'
+    creator_id, creator_name = get_creator(draft_id)
+    if player_id != creator_id:
+        return 'Only the draft creator can {what}.'.format(what=what)
+    return None
+
+
+async def add_bot(draft_id, player_id, strategy=DEFAULT_STRATEGY, count=1):
+    async with get_draft_lock(draft_id):
+        msg = creator_check(draft_id, player_id, 'add bots')
+        if msg is not None:
+            return msg, [], None
+        if draft_started(draft_id):
+            msg = 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id)
+        elif strategy not in STRATEGIES:
+            msg = 'Unknown bot strategy `{strategy}`. Choose one of: {strategies}.'.format(
+                strategy=strategy,
+                strategies=', '.join('`{}`'.format(s) for s in STRATEGIES)
+            )
+        elif not 0 < count <= MAX_BOTS - count_bots(draft_id):
+            msg = 'A draft can have at most {max} bots.'.format(max=MAX_BOTS)
+        else:
+            names = add_bots(draft_id, strategy, count)
+            msg = ('Added {bots} to draft `{draft_id}`.\n'
+                'There are now {num} players registered.').format(
+                    bots=', '.join(names),
+                    draft_id=draft_id,
+                    num=get_num_players(draft_id)
+                )
+    return msg, [], None
+
+
+async def set_delivery(draft_id, player_id, mode):
+    async with get_draft_lock(draft_id):
+        msg = creator_check(draft_id, player_id, 'change how packs are sent')
+        if msg is not None:
+            return msg, [], None
+        if mode not in DELIVERY_MODES:
+            msg = 'Unknown delivery mode `{mode}`. Choose one of: {modes}.'.format(
+                mode=mode,
+                modes=', '.join('`{}`'.format(m) for m in DELIVERY_MODES)
+            )
+        else:
+            set_delivery_mode(draft_id, mode)
+            msg = 'Packs for draft `{draft_id}` will be sent as `{mode}`.'.format(draft_id=draft_id, mode=mode)
+    return msg, [], None
+
+
+async def set_timer(draft_id, player_id, seconds):
+    async with get_draft_lock(draft_id):
+        msg = creator_check(draft_id, player_id, 'set a pick timer')
+        if msg is not None:
+            return msg, [], None
+        if seconds != 'off' and (not seconds.isdigit() or int(seconds) < MIN_PICK_TIME):
+            return 'The pick timer must be a number of seconds, at least {min}, or `off`.'.format(min=MIN_PICK_TIME), [], None
+        pick_time = None if seconds == 'off' else int(seconds)
+        set_pick_time(draft_id, pick_time)
+        for member_id in get_human_players(draft_id):
+            stop_pick_timers(member_id)
+            # packs already open get the new limit from now
+            if pick_time is not None and player_has_open_pack(draft_id, member_id):
+                start_pick_timer(draft_id, member_id, pick_time)
+    if pick_time is None:
+        msg = 'Picks in draft `{draft_id}` have no time limit.'.format(draft_id=draft_id)
+    else:
+        msg = 'Players in draft `{draft_id}` have {seconds} seconds for each pick.'.format(draft_id=draft_id, seconds=pick_time)
+    return msg, [], None
+
+
+# Exports
+
+def forget_exports(player_id):
+    EXPORTS.pop(player_id, None)
+
+
+PLAYER_REMOVED_HANDLERS.append(forget_exports)
+
+
+async def render_picks(draft_id, player_id, export_format):
+    """
+    A player's picks as export files, [(filename, text)] with corp before runner.
+    Rendered in an executor thread, then kept until the player picks again.
+    """
+    picks = get_picks(draft_id, player_id)
+    num_picks = len(picks['corp']) + len(picks['runner'])
+    cached = EXPORTS.get(player_id)
+    if cached is None or cached[0] != num_picks:
+        cached = EXPORTS[player_id] = (num_picks, {})
+    files = cached[1].get(export_format)
+    if files is None:
+        # looked up here, so the thread only has the Cards to work with and no draft state
+        sides = {side: [get_card(code) for code in picks[side]] for side in ('corp', 'runner')}
+        name = 'draft-{draft_id}'.format(draft_id=draft_id)
+        files = await asyncio.get_running_loop().run_in_executor(None, export_files, export_format, name, sides)
+        cached[1][export_format] = files
+    return files
+
+
+async def show_picks(draft_id, player_id):
+    if not is_member(draft_id, player_id):
+        return None, [(player_id, 'You are not enrolled in a draft.', None)], None
+    files = await render_picks(draft_id, player_id, 'text')
+    messages = [(player_id, 'Here are your picks so far:', None)]
+    for heading, (filename, text) in zip(('Corp:\n\n', 'Runner:\n\n'), files):
+        messages.append((player_id, '```' + heading + text + '```', None))
+    return None, messages, None
+
+
+async def export(draft_id, player_id, export_format):
+    """The player's picks as [(filename, text)], or None if they are not in the draft."""
+    if not is_member(draft_id, player_id):
+        return None
+    return await render_picks(draft_id, player_id, export_format)
+
+
+async def encode(draft_id, compact=False):
+    """The draft as written by !debug, or None if it has finished."""
+    if draft_id not in DRAFTS:
+        return None
+    return encode_draft(draft_id, encode_card if compact else encode_full_card)
+
+
+async def draft_ids():
+    return list(DRAFTS)
+
+
+ACTIONS = {
+    'create': create,
+    'describe': describe,
+    'pick': pick,
+    'join': join,
+    'start': start,
+    'cancel': cancel,
+    'leave': leave,
+    'add_bot': add_bot,
+    'set_delivery': set_delivery,
+    'set_timer': set_timer,
+    'show_picks': show_picks,
+    'export': export,
+    'encode': encode,
+    'draft_ids': draft_ids
+}
@@ -1,24 +1,41 @@
 #!/usr/bin/env python
 
 
+import argparse
+import functools
+import gzip
+import io
 import json
 import os
-import random
-import string
 import time
 import asyncio
 import discord
 from discord.ext import commands
 
+import actions
+import metrics
+from dispatch import Dispatcher
+from drafters import DEFAULT_STRATEGY
+from exports import EXPORT_FORMATS
+from drafts import PLAYER_REMOVED_HANDLERS, POOL_DIR, get_card, restore_drafts, use_store
+from pools import pool_names
+from shards import LocalRouter, ShardRouter
+from store import DraftStore
 from templates import blocks, templates
+from transport import DiscordTransport
 
 HERE = os.path.dirname(os.path.abspath(__file__))
-with open(HERE + '/secrets.json', 'r') as f:
-    tokens = json.loads(f.read())
-    DISC_TOKEN = tokens["discord_token"]
+STATE_DB = HERE + '/state.db'
 
 NRDB_IMAGE = "https://netrunnerdb.com/card_image/{code}.png"
 
+# Big enough to hold the whole catalog; cube pools beyond that get LRU eviction.
+RENDER_CACHE_SIZE = 1024
+
+# See drafts.DELIVERY_MODES for how packs can be sent.
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_MESSAGE_LENGTH = 2000
+
 bot_prefix = '!'
 
 description = ('This is a Discord bot for drafting games of Android Netrunner. '
@@ -27,53 +44,45 @@ description = ('This is a Discord bot for drafting games of Android Netrunner. '
     'and the pack will be passed to the next person until the draft is complete. '
     'This bot does not simulate the playing of the game, however.')
 
-bot = commands.Bot(command_prefix=bot_prefix, description=description)
-
-DRAFTS = {}
-PLAYERS = {}
-
-# Getters
-
-def get_draft_id(player_id):
-    return PLAYERS[player_id]['draft_id']
-
-
-def get_seat_number(player_id):
-    return PLAYERS[player_id]['seat_number']
-
+# Commands are read from message text, which discord.py 2.x only receives with the message content intent.
+# It also has to be switched on for the bot in the Discord developer portal.
+intents = discord.Intents.default()
+intents.message_content = True
 
-def get_num_players(draft_id):
-    return len(get_players(draft_id))
+bot = commands.Bot(command_prefix=bot_prefix, description=description, intents=intents)
 
+DISPATCHER = Dispatcher()
+# Where DMs actually go. Load tests swap in a transport.LocalTransport with use_transport().
+TRANSPORT = DiscordTransport(bot)
+DM_CHANNELS = {}
+# Runs the commands' actions on the drafts. main() swaps in one that saves them to STATE_DB,
+# or a shards.ShardRouter when running with --shards.
+ROUTER = LocalRouter()
+METRICS_SERVER = None
 
-def get_players(draft_id):
-    return DRAFTS[draft_id]['players'].keys()
+metrics.gauge('dm_queue_depth', 'DMs waiting to be sent.', DISPATCHER.queue_depth)
+metrics.gauge('dms_sent', 'DMs sent since the bot started.', lambda: DISPATCHER.sent)
+metrics.gauge('dms_failed', 'DMs that failed since the bot started.', lambda: DISPATCHER.failed)
+metrics.gauge('dms_retried', 'DMs retried after a rate limit.', lambda: DISPATCHER.retried)
+metrics.gauge('pick_timers', 'Pick warnings and deadlines pending.', lambda: len(actions.TIMERS))
 
+def use_transport(transport):
+    global TRANSPORT
+    TRANSPORT = transport
+    DM_CHANNELS.clear()
 
-def get_creator(draft_id):
-    return DRAFTS[draft_id]['metadata']['creator']
 
+def use_router(router):
+    global ROUTER
+    ROUTER = router
 
-def get_pack(draft_id, player_id, pack_num):
-    return DRAFTS[draft_id]['players'][player_id]['packs'][pack_num]
 
+def read_token():
+    with open(HERE + '/secrets.json', 'r') as f:
+        tokens = json.loads(f.read())
+        return tokens["discord_token"]
 
-def get_picks(draft_id, player_id):
-    return DRAFTS[draft_id]['players'][player_id]['picks']
-
-
-def get_card(card_code):
-    data_dir = HERE + '/data'
-    corp_ids = read_cards_from_file(data_dir + '/corp_ids.json')
-    corp_cards = read_cards_from_file(data_dir + '/corp_cards.json')
-    runner_ids = read_cards_from_file(data_dir + '/runner_ids.json')
-    runner_cards = read_cards_from_file(data_dir + '/runner_cards.json')
-    all_cards = corp_ids+corp_cards+runner_ids+runner_cards
-
-    for card in all_cards:
-        if card['code'] == card_code:
-            return card
-
+# Getters
 
 async def get_owner():
     if not hasattr(bot, 'appinfo'):
@@ -81,346 +90,257 @@ async def get_owner():
     return (bot.appinfo.owner.id,bot.appinfo.owner.name)
 
 
-#Checks
-
-def is_player(player_id):
-    if player_id in PLAYERS:
-        return True
-    else:
-        return False
+# Discord Helpers
 
+@metrics.timed('send_dm')
+async def send_dm(player_id, content,embed=None,embeds=None,files=None):
+    """
+    Queues a DM behind any others already going to this player and waits for it to be sent.
+    Messages to different players go out concurrently. files are attached as (filename, text).
+    """
+    await DISPATCHER.submit(
+        player_id,
+        functools.partial(deliver_dm, player_id, content, embed, embeds, files)
+    )
 
-def player_has_pack_waiting(draft_id, player_id):
-    inbox = DRAFTS[draft_id]['players'][player_id]['inbox']
-    return len(inbox) > 0
 
+async def deliver_dm(player_id, content, embed, embeds, files=None):
+    dm_channel = await get_dm_channel(player_id)
 
-def player_has_open_pack(draft_id, player_id):
-    return DRAFTS[draft_id]['players'][player_id]['has_open_pack']
+    try:
+        if files:
+            # a discord.File is used up by sending it, so a retry needs new ones
+            await dm_channel.send(content=content,files=[
+                discord.File(io.BytesIO(text.encode('utf-8')), filename=filename)
+                for filename, text in files
+            ])
+        elif embeds:
+            await dm_channel.send(content=content,embeds=embeds)
+        else:
+            await dm_channel.send(content=content,embed=embed)
+    except Exception as error:
+        # a 429 says nothing about the channel, anything else may mean it's stale
+        if getattr(error, 'status', None) != 429:
+            DM_CHANNELS.pop(player_id, None)
+        raise
 
 
-def draft_finished(draft_id):
-    for player in get_players(draft_id):
-        inbox = DRAFTS[draft_id]['players'][player]['inbox']
-        packs = DRAFTS[draft_id]['players'][player]['packs']
-        if len(packs) > 0 or len(inbox) > 0:
-            return False
-    return True
+def cache_dm_channel(player_id):
+    """Remembers a player's DM channel if the transport already has it, without any HTTP."""
+    dm_channel = TRANSPORT.cached_dm_channel(player_id)
+    if dm_channel is not None:
+        DM_CHANNELS[player_id] = dm_channel
 
 
-def draft_started(draft_id):
-    return DRAFTS[draft_id]['metadata']['has_started']
+def forget_dm_channel(player_id):
+    DM_CHANNELS.pop(player_id, None)
 
 
-def user_can_create_draft(username):
-    for draft in DRAFTS:
-        if DRAFTS[draft]['metadata']['creator'] == username:
-            return False
-    return True
+PLAYER_REMOVED_HANDLERS.append(forget_dm_channel)
 
-# Discord Helpers
 
-async def send_dm(player_id, content,embed=None):
-    user = bot.get_user(player_id)
+async def get_dm_channel(player_id):
+    dm_channel = DM_CHANNELS.get(player_id)
+    if dm_channel is None:
+        dm_channel = await TRANSPORT.open_dm_channel(player_id)
+        DM_CHANNELS[player_id] = dm_channel
+    return dm_channel
 
-    if user.dm_channel:
-        dm_channel = user.dm_channel
-    else:
-        await user.create_dm()
-        dm_channel = user.dm_channel
 
-    await dm_channel.send(content=content,embed=embed)
+async def prewarm_dm_channels(player_ids):
+    """
+    Opens DM channels for everyone at once so the first pack doesn't wait on create_dm.
+    Best effort: a channel that can't be opened now is tried again when its DM is sent.
+    """
+    await asyncio.gather(*(
+        get_dm_channel(player_id)
+        for player_id in player_ids
+    ), return_exceptions=True)
 
 
-async def send_card(player_id,card):
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_card(card_code):
+    """
+    Builds the embed for a card once per code.
+    Sending an embed doesn't modify it, so the same object is shared by every DM.
+    Hit/miss counts are available from render_card.cache_info().
+    """
+    card = get_card(card_code)
     card_text = templates.format(card)
-    embedded_card = discord.Embed(title=card['title'])
+    embedded_card = discord.Embed(title=card.title)
     embedded_card.description = card_text
-    embedded_card.add_field(name='To pick this card:',value='```!pick {code}```'.format(code=card['code']))
+    embedded_card.add_field(name='To pick this card:',value='```!pick {code}```'.format(code=card.code))
 
-    if 'image_url' in card:
-        embedded_card.set_image(url=card['image_url'])
+    if card.image_url:
+        embedded_card.set_image(url=card.image_url)
     else:
-        embedded_card.set_image(url=NRDB_IMAGE.format(code=card['code']))
+        embedded_card.set_image(url=NRDB_IMAGE.format(code=card.code))
+
+    return embedded_card
+
 
+metrics.gauge('render_cache_hits', 'Card embeds served from the render cache.', lambda: render_card.cache_info().hits)
+metrics.gauge('render_cache_size', 'Card embeds in the render cache.', lambda: render_card.cache_info().currsize)
+
+
+async def send_card(player_id,card):
     await send_dm(
         player_id=player_id,
         content="Card",
-        embed=embedded_card
+        embed=render_card(card.code)
     )
 
 
-# Draft Setup
-
-def setup_draft(initiating_user_name, initiating_user_id):
-    draft_id = gen_draft_id()
-    while draft_id in DRAFTS:
-        draft_id = gen_draft_id()
-    DRAFTS[draft_id] = {
-        'metadata': {
-            'creator': (initiating_user_id, initiating_user_name),
-            'has_started': False,
-            'stage': 0
-        },
-        'players': {}
-    }
-    add_player(initiating_user_name, initiating_user_id, draft_id)
-    return draft_id
-
-
-def gen_draft_id():
-    code = ''
-    for _ in range(4):
-        total_chars = len(string.ascii_lowercase)
-        index = random.randint(0, total_chars - 1)
-        letter = string.ascii_lowercase[index]
-        code += letter
-    return code
-
-
-def deal_card(draft_id, player_id, pack_num, card):
-    DRAFTS[draft_id]["players"][player_id]['packs'][pack_num].append(
-        card)
-
-
-def read_cards_from_file(filepath):
-    with open(filepath, 'r') as f:
-        cards = json.loads(f.read())['cards']
-        return cards
-
-
-def setup_packs(draft_id):
-    num_players = get_num_players(draft_id)
-    total_ids = num_players * 5
-    card_total = num_players * 15 * 3
-
-    data_dir = HERE + '/data'
-    corp_ids = read_cards_from_file(data_dir + '/corp_ids.json')
-    random.shuffle(corp_ids)
-    corp_ids = corp_ids[:total_ids]
-    corp_cards = read_cards_from_file(data_dir + '/corp_cards.json')
-    random.shuffle(corp_cards)
-    corp_cards = corp_cards[:card_total]
-    runner_ids = read_cards_from_file(data_dir + '/runner_ids.json')
-    random.shuffle(runner_ids)
-    runner_ids = runner_ids[:total_ids]
-    runner_cards = read_cards_from_file(data_dir + '/runner_cards.json')
-    random.shuffle(runner_cards)
-    runner_cards = runner_cards[:card_total]
-
-    pack_num = 0
-    cards_per_pack = len(corp_cards) // (get_num_players(draft_id) * 3)
-    while len(corp_ids) >= get_num_players(draft_id):
-        for player_id in get_players(draft_id):
-            card_index = random.randint(0, len(corp_ids) - 1)
-            card = corp_ids.pop(card_index)
-            deal_card(draft_id, player_id, pack_num, card)
-    pack_num += 1
-
-    while corp_cards and pack_num <= 3:
-        for player_id in get_players(draft_id):
-            card_index = random.randint(0, len(corp_cards) - 1)
-            card = corp_cards.pop(card_index)
-            deal_card(draft_id, player_id, pack_num, card)
-        if len(get_pack(draft_id, player_id, pack_num)) == cards_per_pack:
-            pack_num += 1
-
-    while len(runner_ids) >= get_num_players(draft_id):
-        for player_id in get_players(draft_id):
-            card_index = random.randint(0, len(runner_ids) - 1)
-            card = runner_ids.pop(card_index)
-            deal_card(draft_id, player_id, pack_num, card)
-    pack_num += 1
-
-    while len(runner_cards) >= get_num_players(draft_id):
-        for player_id in get_players(draft_id):
-            card_index = random.randint(0, len(runner_cards) - 1)
-            card = runner_cards.pop(card_index)
-            deal_card(draft_id, player_id, pack_num, card)
-        if len(get_pack(draft_id, player_id, pack_num)) == cards_per_pack:
-            pack_num += 1
-
-
-def add_player(player_name, player_id, draft_id):
-    DRAFTS[draft_id]['players'][player_id] = {
-        'inbox': [],
-        'packs': [[], [], [], [], [], [], [], []],
-        'picks': {
-            'corp': [],
-            'runner': []
-        },
-        'has_open_pack': False
-    }
-    PLAYERS[player_id] = {
-        'player_name': player_name,
-        'draft_id': draft_id,
-    }
-
-    return 'ADD_SUCCESSFUL'
-
-
-def remove_player(player_id, draft_id):
-    if draft_id not in DRAFTS:
-        return 'Draft `{draft_id}` does not exist.'.format(draft_id=draft_id)
-    if DRAFTS[draft_id]['metadata']['has_started']:
-        return 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id)
-    if player_id not in get_players(draft_id):
-        return 'You were not registered for `{draft_id}`.'.format(draft_id=draft_id)
-    del DRAFTS[draft_id]['players'][player_id]
-    return 'ok'
-
-
-def assign_seat_numbers(draft_id):
-    num_players = get_num_players(draft_id)
-    seats = list(range(num_players))
-    random.shuffle(seats)
-    for player_id in get_players(draft_id):
-        PLAYERS[player_id]['seat_number'] = seats.pop(0)
-
-
-# Draft Operations
-
-async def open_new_pack(draft_id):
+def format_pack_list(pack):
     """
-    Sends first set of picks to players.
-    After this the pack-sending logic is entirely event-driven.
+    Lists a pack as text, split into as few messages as Discord's length limit allows.
     """
-    for player_id in get_players(draft_id):
-        pack = DRAFTS[draft_id]['players'][player_id]['packs'].pop(0)
-        DRAFTS[draft_id]['players'][player_id]['inbox'].append(pack)
-
-        for i, card in enumerate(pack):
-            await send_card(player_id,card)
-
-        DRAFTS[draft_id]['players'][player_id]['has_open_pack'] = True
-
-
-def handle_pick(draft_id, player_id, card_code):
-    pack = DRAFTS[draft_id]['players'][player_id]['inbox'].pop(0)
-    for i, card in enumerate(pack):
-        if card['code'] == card_code:
-            card_index = i
-            break
-    picked_card = pack.pop(card_index)
-    add_card_to_picks(draft_id, player_id, picked_card)
-    DRAFTS[draft_id]['players'][player_id]['has_open_pack'] = False
-    if len(pack) > 0:
-        pass_pack(draft_id, player_id, pack)
-
-
-def add_card_to_picks(draft_id, player_id, picked_card):
-    draft = DRAFTS[draft_id]
-    player = draft['players'][player_id]
-    player_picks = player['picks'][picked_card['side_code']]
-    player_picks.append(picked_card['title'])
-
-
-def pass_pack(draft_id, player_id, pack):
-    player_seat = get_seat_number(player_id)
-    next_seat = (player_seat + 1) % get_num_players(draft_id)
-    for player_id in get_players(draft_id):
-        if get_seat_number(player_id) == next_seat:
-            DRAFTS[draft_id]['players'][player_id]['inbox'].append(pack)
-
-
-async def open_next_pack(draft_id, player_id):
-    pack = DRAFTS[draft_id]['players'][player_id]['inbox'][0]
-    
-    await send_dm(
-        player_id=player_id,
-        content='Here is your next pack.'
-    )
+    messages = []
+    lines = ['Pick a card with `!pick [code]`:']
+    length = len(lines[0])
     for card in pack:
-        await send_card(player_id,card)
-    
-    DRAFTS[draft_id]['players'][player_id]['has_open_pack'] = True
-
+        line = '`{code}` {title} ({type}, {faction})'.format(
+            code=card.code,
+            title=card.title,
+            type=card.type_code.title(),
+            faction=card.faction_code.title()
+        )
+        if length + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            messages.append('\n'.join(lines))
+            lines = []
+            length = 0
+        lines.append(line)
+        length += len(line) + 1
+    messages.append('\n'.join(lines))
+    return messages
+
+
+async def send_pack(mode, player_id, pack):
+    if mode == 'list':
+        for message in format_pack_list(pack):
+            await send_dm(
+                player_id=player_id,
+                content=message
+            )
+    elif mode == 'embeds':
+        for i in range(0, len(pack), MAX_EMBEDS_PER_MESSAGE):
+            await send_dm(
+                player_id=player_id,
+                content='Cards',
+                embeds=[render_card(card.code) for card in pack[i:i + MAX_EMBEDS_PER_MESSAGE]]
+            )
+    else:
+        for card in pack:
+            await send_card(player_id,card)
 
-async def open_next_pack_or_wait(draft_id, player_id, card):
 
-    card_name = card['title']
-    await send_dm(
-        player_id=player_id, 
-        content='{} was picked. A new pack will open once it is passed to you.'.format(card_name)
-    )
-    need_new_pack = True
-    
-    for player_id in get_players(draft_id):
-        if player_has_pack_waiting(draft_id, player_id):
-            need_new_pack = False
-            if not player_has_open_pack(draft_id, player_id):
-                await open_next_pack(draft_id, player_id)
-
-    if need_new_pack:
-        if draft_finished(draft_id):
-            for player_id in get_players(draft_id):
-                
-                await send_dm(
-                    player_id=player_id,
-                    content='The draft is complete! Here are your picks:'
-                )
-                picks = get_picks(draft_id, player_id)
-                
-                await send_dm(
-                    player_id=player_id,
-                    content=format_picks('Corp:\n\n', picks['corp'])
-                )
-                await send_dm(
-                    player_id=player_id,
-                    content=format_picks('Runner:\n\n', picks['runner'])
-                )
-            cleanup(draft_id)
-        else:
-            await open_new_pack(draft_id)
+async def deliver(messages, delivery):
+    """
+    Sends the messages returned by draft operations, as (player_id, content, pack) where
+    either content or pack may be None. Each player's messages go out in order and
+    different players' go out concurrently.
+    """
+    by_player = {}
+    for player_id, content, pack in messages:
+        by_player.setdefault(player_id, []).append((content, pack))
+    await asyncio.gather(*(
+        deliver_to_player(player_id, queued, delivery)
+        for player_id, queued in by_player.items()
+    ))
+
+
+async def deliver_to_player(player_id, queued, delivery):
+    for content, pack in queued:
+        if content is not None:
+            await send_dm(
+                player_id=player_id,
+                content=content
+            )
+        if pack is not None:
+            await send_pack(delivery, player_id, pack)
 
 
-def cleanup(draft_id):
-    del DRAFTS[draft_id]
-    # make a copy for iteration so you can delete from the real one
-    for player_id in list(PLAYERS.keys()):
-        if PLAYERS[player_id]['draft_id'] == draft_id:
-            del PLAYERS[player_id]
+actions.use_deliver(deliver)
 
 
-def format_picks(heading, picks):
-    picks_copy = picks[:]
-    for i, card in enumerate(picks_copy):
-        if i < 5 or 49 < i < 53:
-            pre = '1 '
-        else:
-            pre = '3 '
-        picks_copy[i] = pre + card
-    cards = '\n'.join(picks_copy)
-    return '```' + heading + '\n' + cards + '```'
+# Bot Commands
 
+async def run_action(ctx, action, *args):
+    """Runs an action on the caller's draft, sends the messages it returns, then its reply."""
+    draft_id = ROUTER.draft_of(ctx.author.id)
+    if draft_id is None:
+        await ctx.send(content = 'You are not enrolled in a draft.')
+        return
+    msg, messages, delivery = await ROUTER.call(draft_id, action, ctx.author.id, *args)
+    await deliver(messages, delivery)
+    if msg:
+        await ctx.send(content = msg)
 
-# Bot Commands
 
 @bot.command(brief='Pick a card from the pack.')
 async def pick(ctx, card_code):
-    player_name = ctx.author.name
     player_id = ctx.author.id
+    draft_id = ROUTER.draft_of(player_id)
 
-    if is_player(player_id):
-       
-        draft_id = get_draft_id(player_id)
-        handle_pick(draft_id, player_id, card_code)
-        card = get_card(card_code)
-        await open_next_pack_or_wait(draft_id, player_id, card)
+    if draft_id is not None:
+        msg, messages, delivery = await ROUTER.call(draft_id, 'pick', player_id, card_code)
+        if msg:
+            await ctx.send(msg)
+        else:
+            await deliver(messages, delivery)
     else:
         await ctx.send('You are not in a draft.')
 
 
-@bot.command(brief='Reserved for owner', description='Dumps a log of the the players joined and cards in the packs. Log located in anrdraft folder.', aliases=['dump'])
-async def debug(ctx, name=None):
+async def dump_drafts(filepath, draft_ids, compact=False):
+    """
+    Writes a gzipped JSON Lines dump: a header line, then one line per draft.
+    Each draft is encoded by whatever runs it so it's consistent, but compression and
+    disk writes happen in an executor thread, and other drafts carry on in between.
+    """
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(None, gzip.open, filepath, 'wt')
+    try:
+        header = json.dumps({
+            'dumped_at': time.strftime("%Y-%m-%d %H:%M"),
+            'drafts': list(draft_ids),
+            'compact': compact
+        })
+        await loop.run_in_executor(None, f.write, header + '\n')
+        for draft_id in draft_ids:
+            draft = await ROUTER.call(draft_id, 'encode', compact)
+            # the draft may have finished while earlier ones were being written
+            if draft is None:
+                continue
+            line = json.dumps({
+                'draft_id': draft_id,
+                'draft': draft
+            }, sort_keys=True)
+            await loop.run_in_executor(None, f.write, line + '\n')
+    finally:
+        await loop.run_in_executor(None, f.close)
+
+
+@bot.command(brief='Reserved for owner', description='Dumps a log of the the players joined and cards in the packs. Log located in anrdraft folder. '
+    'Options: a draft ID to dump only that draft, "compact" to write card codes instead of whole cards, anything else names the file.', aliases=['dump'])
+async def debug(ctx, *options):
     (id,owner) = await get_owner();
     if ctx.author.name == owner:
-        with open('debug{name}-{datetime}.log'.format(name=('' if name == None else '-'+name), datetime = time.strftime("%Y-%m-%d_%H%M")), 'w') as f:
-            f.write(json.dumps({
-                'dumped_at': time.strftime("%Y-%m-%d %H:%M"),
-                'PLAYERS': PLAYERS,
-                'DRAFTS': DRAFTS
-            }, indent=4, sort_keys=True))
+        name = None
+        all_draft_ids = await ROUTER.draft_ids()
+        draft_ids = None
+        compact = False
+        for option in options:
+            if option == 'compact':
+                compact = True
+            elif option in all_draft_ids:
+                draft_ids = [option]
+            else:
+                name = option
+        if draft_ids is None:
+            draft_ids = all_draft_ids
+        filepath = 'debug{name}-{datetime}.log.gz'.format(name=('' if name == None else '-'+name), datetime = time.strftime("%Y-%m-%d_%H%M"))
+        await dump_drafts(filepath, draft_ids, compact)
         msg = 'Dump successful.'
     else:
         msg = 'Only an admin can use this command.'
@@ -428,18 +348,33 @@ async def debug(ctx, name=None):
     await ctx.send(msg)
 
 
+@bot.command(brief='Reserved for owner', description='Shows draft counts and how long the bot spends picking, passing and sending DMs.')
+async def stats(ctx):
+    (id,owner) = await get_owner()
+    if ctx.author.id == id:
+        msg = '```' + metrics.summary() + '```'
+    else:
+        msg = 'Only an admin can use this command.'
+    await ctx.send(msg)
+
+
 @bot.command(name='create', brief='Create a new draft. (Can only create one at a time)', aliases=['createdraft'])
-async def create_draft(ctx):
+async def create_draft(ctx, pool=None):
     user_name = ctx.author.name
-    if user_can_create_draft(user_name):
-        user_id = ctx.author.id
-        new_draft_code = setup_draft(user_name, user_id)
-        msg = ('Draft successfully created.\n'
-            'Your draft ID is `{draft_id}`.\n'
-            'Other players can use this code with the `!join {draft_id}` command to join the draft.').format(draft_id=new_draft_code)
+    user_id = ctx.author.id
+    msg, messages, delivery = await ROUTER.create(user_name, user_id, pool)
+    if ROUTER.draft_of(user_id) is not None:
+        cache_dm_channel(user_id)
+    await ctx.send(content = msg)
+
+
+@bot.command(name='pools', brief='List the card pools a draft can use.')
+async def list_pools(ctx):
+    names = pool_names(POOL_DIR)
+    if names:
+        msg = 'Available card pools: {}'.format(', '.join('`{}`'.format(name) for name in names))
     else:
-        msg = ('You can only create one draft at a time.\n'
-            'You can use `!canceldraft [draft_id]` to quit and then start over.')
+        msg = 'There are no card pools set up. Drafts use every card.'
     await ctx.send(content = msg)
 
 
@@ -447,14 +382,15 @@ async def create_draft(ctx):
 async def cancel_draft(ctx):
     player_name = ctx.author.name
     player_id = ctx.author.id
+    draft_id = ROUTER.draft_of(player_id)
+    draft = None if draft_id is None else await ROUTER.call(draft_id, 'describe')
 
-    if is_player(player_id):
-        draft_id = get_draft_id(player_id)
-        creator_id, creator_name = get_creator(draft_id)
+    if draft is not None:
+        creator_id, creator_name = draft['creator']
 
         if player_id != creator_id:
             msg = 'Only the draft creator can cancel it.'
-        elif draft_started(draft_id):
+        elif draft['started']:
             timeout = 30
 
             def check(m):
@@ -482,130 +418,100 @@ async def cancel_draft(ctx):
 
 @bot.command(name='start', brief='Start the draft. (Only for creator)', aliases=['startdraft'])
 async def start_draft(ctx):
-    msg = ''
-    user_name = ctx.author.name
     user_id = ctx.author.id
+    draft_id = ROUTER.draft_of(user_id)
 
-    if is_player(user_id):
-        draft_id = get_draft_id(user_id)
-        creator_id, creator_name = get_creator(draft_id)
-
-        if creator_id != creator_id:
-            msg  = 'Only the draft creator can start the draft.'
-        elif draft_started(draft_id):
-            msg = 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id)
-        else:
-            await ctx.send('Draft `{draft_id}` is starting!'.format(draft_id=draft_id))
-            setup_packs(draft_id)
-            assign_seat_numbers(draft_id)
-            DRAFTS[draft_id]['metadata']['has_started'] = True
-            for player_id in get_players(draft_id):
-                
-                await send_dm(
-                    player_id=player_id,
-                    content='Welcome to the draft! Here is your first pack. Good luck!'
-                )
-            await open_new_pack(draft_id)
+    if draft_id is not None:
+        msg, messages, delivery = await ROUTER.call(draft_id, 'start', user_id)
+        await ctx.send(content = msg)
+        if messages:
+            # only humans are sent messages, and every one of them gets a pack
+            await prewarm_dm_channels({player_id for player_id, content, pack in messages})
+            await deliver(messages, delivery)
     else:
-        msg = 'You are not enrolled in a draft.'
+        await ctx.send(content = 'You are not enrolled in a draft.')
+
+
+@bot.command(name='addbot', brief='Fill a seat with a bot. (Only for creator)', description='Bots pick as soon as they are passed a pack. '
+    'Strategies: random, faction (sticks to the factions it has picked) or rating (takes the best rated card). Defaults to faction.', aliases=['addbots'])
+async def add_bot(ctx, strategy=DEFAULT_STRATEGY, count: int = 1):
+    await run_action(ctx, 'add_bot', strategy, count)
 
-    if msg:
-        await ctx.send(content = msg)
+
+@bot.command(name='delivery', brief='Choose how packs are sent. (Only for creator)', description='cards: one message per card. embeds: up to 10 cards per message. list: one message listing titles and codes.')
+async def set_delivery(ctx, mode):
+    await run_action(ctx, 'set_delivery', mode)
+
+
+@bot.command(name='timer', brief='Set a time limit for each pick. (Only for creator)', description='Seconds each player has to pick from a pack before the best rated card is picked for them, or "off". '
+    'A warning is sent shortly before time runs out.')
+async def set_timer(ctx, seconds):
+    await run_action(ctx, 'set_timer', seconds)
 
 
 @bot.command(name='join', brief='Join a draft. (Creator already joined)', aliases=['joindraft'])
 async def join_draft(ctx, draft_id):
     player_name = ctx.author.name
     player_id = ctx.author.id
+    current_draft_id = ROUTER.draft_of(player_id)
 
-    if player_id in get_players(draft_id):
+    if current_draft_id == draft_id:
         msg = 'You can not join the same draft more than once.'
-    elif player_id in PLAYERS:
+    elif current_draft_id is not None:
         msg = 'You can not join more than one draft.'
-    elif draft_id not in DRAFTS:
-        msg = 'Draft does not exist.'
-    elif draft_started(draft_id):
-        msg = 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id)
     else:
-        add_player(player_name, player_id, draft_id)
-        creator_id,creator_name = get_creator(draft_id)
-        num_players = get_num_players(draft_id)
-        await send_dm(
-            player_id=creator_id,
-            content=('{player} has joined your draft (`{draft}`).\n'
-                'There are now {num} players registered.').format(player=player_name, draft=draft_id, num=num_players)
-        )
-        msg = ('Successfully joined draft `{draft_id}`.\n'
-            'Please wait for `{creator}` to begin the draft.').format(
-                draft_id=draft_id, 
-                creator=creator_name
-            )
+        msg, messages, delivery = await ROUTER.call(draft_id, 'join', player_id, player_name)
+        if messages:
+            cache_dm_channel(player_id)
+            await deliver(messages, delivery)
     await ctx.send(content = msg)
 
 
 @bot.command(name='leave', brief='Leave a draft.', description='Leaves draft. Can\'t be done once draft is started', aliases=['leavedraft'])
 async def leave_draft(ctx):
-    player_name = ctx.author.name
-    player_id = ctx.author.id
-
-    if is_player(player_id):
-        draft_id = get_draft_id(player_id)
-        creator_id, creator_name =get_creator(draft_id)
-        # remove_player() does the checks I usually do here
-        res = remove_player(player_id, draft_id)
-        if res != 'ok':
-            msg = 'Failed to leave draft. Error: ' + res
-        elif player_id == creator_id:
-            await _cancel_draft(draft_id)
-            msg = ('Successfully withdrew from draft `{draft_id}`.\n'
-                'Because you were the creator of this draft it has been cancelled. \n'
-                'The other players have been notified.').format(draft_id=draft_id)
-        else:
-            
-            num_players = get_num_players(draft_id)
-            await send_dm(
-                player_id = creator_id,
-                content = ('{player} has left your draft (`{draft}`).\n'
-                    'There are now {num} players registered.').format(
-                        player=player_name, 
-                        draft=draft_id, 
-                        num=num_players
-                    )
-            )
-            msg = 'Successfully withdrew from draft `{draft_id}`.'.format(draft_id=draft_id)
-    else:
-        msg = 'You are not enrolled in a draft.'
-
-    await ctx.send(content = msg)
+    await run_action(ctx, 'leave', ctx.author.name)
 
 
 @bot.command(name='showpicks', brief='Show cards YOU have picked.', aliases=['picks'])
 async def show_picks(ctx):
-    player_name = ctx.author.name
     player_id = ctx.author.id
-    if player_id not in PLAYERS:
+    draft_id = ROUTER.draft_of(player_id)
+    if draft_id is None:
         await send_dm(
             player_id = player_id,
             content = 'You are not enrolled in a draft.'
         )
     else:
-        draft_id = PLAYERS[player_id]['draft_id']
-        
-        await send_dm(
-            player_id =player_id,
-            content='Here are your picks so far:'
-        )
-        picks = get_picks(draft_id, player_id)
-        
-        await send_dm(
-            player_id=player_id,
-            content=format_picks('Corp:\n\n', picks['corp'])
-        )
-        
-        await send_dm(
-            player_id=player_id,
-            content=format_picks('Runner:\n\n', picks['runner'])
+        msg, messages, delivery = await ROUTER.call(draft_id, 'show_picks', player_id)
+        await deliver(messages, delivery)
+
+
+@bot.command(name='export', brief='Export YOUR picks as deck files.', description='Formats: text (NetrunnerDB and jinteki.net import), json, or o8d (OCTGN). '
+    'Sent as files by DM, one per side except for json.')
+async def export_picks(ctx, export_format='text'):
+    player_id = ctx.author.id
+    draft_id = ROUTER.draft_of(player_id)
+
+    if export_format not in EXPORT_FORMATS:
+        msg = 'Unknown export format `{format}`. Choose one of: {formats}.'.format(
+            format=export_format,
+            formats=', '.join('`{}`'.format(f) for f in EXPORT_FORMATS)
         )
+    elif draft_id is None:
+        msg = 'You are not enrolled in a draft.'
+    else:
+        # None if the draft ended while this waited its turn
+        files = await ROUTER.call(draft_id, 'export', player_id, export_format)
+        if files is None:
+            msg = 'You are not enrolled in a draft.'
+        else:
+            await send_dm(
+                player_id=player_id,
+                content='Here are your picks so far as `{format}`:'.format(format=export_format),
+                files=files
+            )
+            msg = 'Your picks have been sent to you.'
+    await ctx.send(content = msg)
 
 
 @bot.command(brief='Tells you the owner. (Can also send them a message)')
@@ -625,6 +531,7 @@ async def owner(ctx, *message):
 
 @bot.event
 async def on_ready():
+    global METRICS_SERVER
     if not hasattr(bot, 'appinfo'):
         bot.appinfo = await bot.application_info()
     appinfo = bot.appinfo
@@ -635,6 +542,10 @@ async def on_ready():
     print(bot.user.name)
     print(bot.user.id)
     print('------')
+    # on_ready runs again after reconnects, only resume once
+    if not ROUTER.started:
+        METRICS_SERVER = await metrics.start_server()
+        await ROUTER.start()
 
 
 @bot.event
@@ -647,19 +558,29 @@ async def on_command_error(ctx, error):
 
 
 async def _cancel_draft(draft_id):
-    creator_id, creator_name = get_creator(draft_id)
-    for player_id in get_players(draft_id):
-        
-        await send_dm(
-            player_id=player_id,
-            content='Draft `{draft_id}` was cancelled by `{creator}`.'.format(
-                    draft_id=draft_id,
-                    creator=creator_name
-                )
-            
-        )
-    cleanup(draft_id)
+    msg, messages, delivery = await ROUTER.call(draft_id, 'cancel')
+    await deliver(messages, delivery)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the draft bot.')
+    parser.add_argument('--shards', type=int, default=0, help='run drafts in this many worker processes, each saving to its own state-N.db')
+    args = parser.parse_args()
+
+    if args.shards:
+        use_router(ShardRouter(args.shards, HERE + '/state-{shard}.db', deliver, forget_dm_channel))
+    else:
+        store = DraftStore(STATE_DB)
+        use_store(store)
+        use_router(LocalRouter(store))
+        restored = restore_drafts()
+        if restored:
+            print('Restored drafts: {}'.format(', '.join(restored)))
+    try:
+        bot.run(read_token())
+    finally:
+        ROUTER.close()
 
 
 if __name__ == '__main__':
-    bot.run(DISC_TOKEN)
+    main()
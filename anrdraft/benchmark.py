@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""
+Pick throughput benchmark.
+
+Simulates concurrent drafts of bot players making random picks, with no Discord
+connection, and reports picks per second, pick latency and peak memory.
+
+    python benchmark.py --drafts 20 --players 8
+"""
+
+import argparse
+import asyncio
+import resource
+import time
+import tracemalloc
+
+from simulate import RecordingTransport, simulate
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(num_drafts, num_players, latency, seed, num_bots=0):
+    transport = RecordingTransport(latency)
+    pick_latencies = []
+    started = time.perf_counter()
+    picks = asyncio.run(simulate(num_drafts, num_players, transport, seed, pick_latencies, num_bots))
+    elapsed = time.perf_counter() - started
+    return picks, elapsed, pick_latencies, transport
+
+
+def peak_memory(num_drafts, num_players, latency, seed, num_bots=0):
+    """Runs the same simulation again under tracemalloc, which is too slow to time."""
+    tracemalloc.start()
+    try:
+        run(num_drafts, num_players, latency, seed, num_bots)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark draft pick throughput without Discord.')
+    parser.add_argument('--drafts', type=int, default=10, help='number of concurrent drafts')
+    parser.add_argument('--players', type=int, default=8, help='players in each draft')
+    parser.add_argument('--bots', type=int, default=0, help='bot drafters in each draft, as well as the players')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each delivery takes')
+    parser.add_argument('--seed', type=int, default=1, help='seed for draft ids, packs and picks')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory run')
+    args = parser.parse_args()
+
+    picks, elapsed, pick_latencies, transport = run(args.drafts, args.players, args.latency, args.seed, args.bots)
+
+    print('drafts:          {} x {} players + {} bots'.format(args.drafts, args.players, args.bots))
+    print('picks:           {}'.format(picks))
+    print('messages:        {} ({} packs)'.format(transport.messages, transport.packs))
+    print('elapsed:         {:.3f} s'.format(elapsed))
+    print('picks/sec:       {:.0f}'.format(picks / elapsed))
+    print('pick p50:        {:.1f} us'.format(percentile(pick_latencies, 0.50) * 1e6))
+    print('pick p99:        {:.1f} us'.format(percentile(pick_latencies, 0.99) * 1e6))
+    # ru_maxrss is in kilobytes on Linux
+    print('peak rss:        {:.1f} MB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    if not args.no_memory:
+        peak = peak_memory(args.drafts, args.players, args.latency, args.seed, args.bots)
+        print('peak traced:     {:.1f} MB'.format(peak / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+
+CARD_FILES = ('corp_ids', 'corp_cards', 'runner_ids', 'runner_cards')
+
+# The card files compiled into one read-only columnar file, kept next to them and memory-mapped,
+# so every bot process and shard on a host shares a single copy of the card data. Rebuilt
+# whenever a card file changes, or CARD_FIELDS or the layout below do.
+CACHE_FILE = 'cards.cache'
+CACHE_VERSION = 3
+
+# Only what the draft and templates.format read. Everything else in the
+# NetrunnerDB data (flavor, illustrator, position, ...) is dropped on load.
+CARD_FIELDS = (
+    'code', 'title', 'type_code', 'side_code', 'faction_code', 'pack_code',
+    'keywords', 'text', 'cost', 'trash_cost', 'strength', 'agenda_points',
+    'advancement_cost', 'memory_cost', 'image_url'
+)
+
+# Short codes repeated across hundreds of cards, shared instead of copied.
+INTERNED_FIELDS = ('type_code', 'side_code', 'faction_code', 'pack_code')
+
+# How each field is stored in the cache: fixed-width, NUL padded columns for the short codes,
+# 32-bit integer columns for the numbers, and everything else in a UTF-8 blob with an offset table.
+FIXED_FIELDS = ('code',) + INTERNED_FIELDS
+INT_FIELDS = ('cost', 'trash_cost', 'strength', 'agenda_points', 'advancement_cost', 'memory_cost')
+STRING_FIELDS = tuple(field for field in CARD_FIELDS if field not in FIXED_FIELDS + INT_FIELDS)
+
+# magic, version, sha1 of what the cache was built from, number of cards
+HEADER = struct.Struct('<4sI20sI')
+# each card file's name and its first card and number of cards, in CARD_FILES order
+FILE_ENTRY = struct.Struct('<16sII')
+# the width of each fixed column, in FIXED_FIELDS order
+WIDTHS = struct.Struct('<{}I'.format(len(FIXED_FIELDS)))
+MAGIC = b'ANRC'
+
+
+class _Null:
+    """
+    A field the card data lists as null, which is how NetrunnerDB writes X costs and strengths.
+    Kept apart from None, a field the card doesn't have, so templates show it as 'None' like
+    the dicts cards used to be loaded as.
+    """
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'None'
+
+    def __reduce__(self):
+        return 'NULL'
+
+
+NULL = _Null()
+
+
+class Card(namedtuple('Card', CARD_FIELDS)):
+    """
+    Immutable record for a single card, with no per-instance __dict__.
+    Packs and picks hold references to the catalog's instances, never copies.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, data):
+        values = []
+        for field in CARD_FIELDS:
+            value = data.get(field)
+            if value is None and field in data:
+                value = NULL
+            elif field in INTERNED_FIELDS and value is not None:
+                value = sys.intern(value)
+            values.append(value)
+        return cls(*values)
+
+    def get(self, field, default=None):
+        """Mirrors dict.get so templates can treat missing fields the same way."""
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def as_dict(self):
+        """The card's fields as the JSON card data had them, with NULL back to None."""
+        return {field: None if value is NULL else value for field, value in zip(self._fields, self)}
+
+
+def read_cards_from_file(filepath):
+    with open(filepath, 'r') as f:
+        cards = json.loads(f.read())['cards']
+        return cards
+
+
+def source_digest(data_dir):
+    """Identifies what a cache is built from: its version, the fields, and each card file's size and mtime."""
+    files = []
+    for name in CARD_FILES:
+        stat = os.stat('{}/{}.json'.format(data_dir, name))
+        files.append((name, stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(repr((CACHE_VERSION, CARD_FIELDS, files)).encode('utf-8')).digest()
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def cache_layout(num_cards, widths):
+    """
+    Where each section of a cache starts. Worked out from the header alone, so the
+    writer and every reader agree without storing the offsets.
+    """
+    offset = HEADER.size + FILE_ENTRY.size * len(CARD_FILES) + WIDTHS.size
+    layout = {}
+    for field, width in zip(FIXED_FIELDS, widths):
+        offset = _align(offset)
+        layout[field] = offset
+        offset += num_cards * width
+    for field in INT_FIELDS:
+        offset = _align(offset)
+        layout[field] = offset
+        offset += num_cards * 4
+    # one bit per CARD_FIELDS position, set where the card's value is None
+    offset = _align(offset)
+    layout['nulls'] = offset
+    offset += num_cards * 2
+    # the same, set where it's NULL
+    offset = _align(offset)
+    layout['listed_nulls'] = offset
+    offset += num_cards * 2
+    # where each string field starts in the blob, and one more for where the last one ends
+    offset = _align(offset)
+    layout['string_offsets'] = offset
+    offset += (num_cards * len(STRING_FIELDS) + 1) * 4
+    # card indices sorted by code, for finding a card by its code
+    offset = _align(offset)
+    layout['by_code'] = offset
+    offset += num_cards * 4
+    layout['blob'] = offset
+    return layout
+
+
+def write_cache(cache_path, digest, by_file):
+    cards = [card for name in CARD_FILES for card in by_file[name]]
+    widths = [
+        max([len((getattr(card, field) or '').encode('utf-8')) for card in cards] + [1])
+        for field in FIXED_FIELDS
+    ]
+    layout = cache_layout(len(cards), widths)
+
+    blob = bytearray()
+    string_offsets = []
+    for card in cards:
+        for field in STRING_FIELDS:
+            string_offsets.append(len(blob))
+            blob += (getattr(card, field) or '').encode('utf-8')
+    string_offsets.append(len(blob))
+
+    data = bytearray(layout['blob'])
+    HEADER.pack_into(data, 0, MAGIC, CACHE_VERSION, digest, len(cards))
+    first = 0
+    for position, name in enumerate(CARD_FILES):
+        FILE_ENTRY.pack_into(data, HEADER.size + position * FILE_ENTRY.size, name.encode('utf-8'), first, len(by_file[name]))
+        first += len(by_file[name])
+    WIDTHS.pack_into(data, HEADER.size + FILE_ENTRY.size * len(CARD_FILES), *widths)
+    for field, width in zip(FIXED_FIELDS, widths):
+        for index, card in enumerate(cards):
+            value = (getattr(card, field) or '').encode('utf-8')
+            data[layout[field] + index * width:layout[field] + index * width + len(value)] = value
+    for field in INT_FIELDS:
+        struct.pack_into('<{}i'.format(len(cards)), data, layout[field], *(getattr(card, field) or 0 for card in cards))
+    for section, null in (('nulls', None), ('listed_nulls', NULL)):
+        bits = []
+        for card in cards:
+            card_bits = 0
+            for position, value in enumerate(card):
+                if value is null:
+                    card_bits |= 1 << position
+            bits.append(card_bits)
+        struct.pack_into('<{}H'.format(len(cards)), data, layout[section], *bits)
+    struct.pack_into('<{}I'.format(len(string_offsets)), data, layout['string_offsets'], *string_offsets)
+    by_code = sorted(range(len(cards)), key=lambda index: cards[index].code.encode('utf-8'))
+    struct.pack_into('<{}I'.format(len(cards)), data, layout['by_code'], *by_code)
+    data += blob
+
+    # written whole then renamed, so another process never maps half a cache, and
+    # processes that already mapped the old one keep reading it
+    temp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class MappedCards:
+    """
+    A cache file mapped read-only. Reads single fields of single cards straight from the
+    mapping, so nothing is built for cards that are never looked at.
+    Raises ValueError if the file isn't a cache built from digest.
+    """
+
+    def __init__(self, cache_path, digest):
+        with open(cache_path, 'rb') as f:
+            # the mapping stays valid after the file is closed
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            raise ValueError('Card cache is truncated.')
+        magic, version, cached_digest, self.num_cards = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != CACHE_VERSION or cached_digest != digest:
+            raise ValueError('Card cache is out of date.')
+        self.files = {}
+        for position, name in enumerate(CARD_FILES):
+            _, first, count = FILE_ENTRY.unpack_from(self.data, HEADER.size + position * FILE_ENTRY.size)
+            self.files[name] = range(first, first + count)
+        widths = WIDTHS.unpack_from(self.data, HEADER.size + FILE_ENTRY.size * len(CARD_FILES))
+        self.widths = dict(zip(FIXED_FIELDS, widths))
+        self.layout = cache_layout(self.num_cards, widths)
+        if len(self.data) < self.layout['blob']:
+            raise ValueError('Card cache is truncated.')
+
+    def __len__(self):
+        return self.num_cards
+
+    def fixed(self, field, index):
+        width = self.widths[field]
+        start = self.layout[field] + index * width
+        return self.data[start:start + width].rstrip(b'\0').decode('utf-8')
+
+    def value(self, index, field):
+        """One field of the card at index, without reading the rest of it."""
+        position = CARD_FIELDS.index(field)
+        nulls, = struct.unpack_from('<H', self.data, self.layout['nulls'] + index * 2)
+        if nulls >> position & 1:
+            return None
+        listed_nulls, = struct.unpack_from('<H', self.data, self.layout['listed_nulls'] + index * 2)
+        if listed_nulls >> position & 1:
+            return NULL
+        if field in self.widths:
+            return self.fixed(field, index)
+        if field in INT_FIELDS:
+            return struct.unpack_from('<i', self.data, self.layout[field] + index * 4)[0]
+        position = index * len(STRING_FIELDS) + STRING_FIELDS.index(field)
+        start, end = struct.unpack_from('<II', self.data, self.layout['string_offsets'] + position * 4)
+        blob = self.layout['blob']
+        return self.data[blob + start:blob + end].decode('utf-8')
+
+    def card(self, index):
+        values = []
+        for field in CARD_FIELDS:
+            value = self.value(index, field)
+            if field in INTERNED_FIELDS and value:
+                value = sys.intern(value)
+            values.append(value)
+        return Card._make(values)
+
+    def find(self, card_code):
+        """The index of the card with this code, or None, by binary search over the codes."""
+        target = card_code.encode('utf-8')
+        by_code = self.layout['by_code']
+        low, high = 0, self.num_cards
+        while low < high:
+            middle = (low + high) // 2
+            index, = struct.unpack_from('<I', self.data, by_code + middle * 4)
+            width = self.widths['code']
+            start = self.layout['code'] + index * width
+            code = self.data[start:start + width].rstrip(b'\0')
+            if code == target:
+                return index
+            if code < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+class CardList(Sequence):
+    """The cards from one data file or group, each built from the cache the first time it's used."""
+
+    def __init__(self, catalog, indices):
+        self.catalog = catalog
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.catalog.card(index) for index in self.indices[position]]
+        return self.catalog.card(self.indices[position])
+
+
+class CardCatalog:
+    """
+    Every card the bot knows about, mapped from the cache the first time one is needed.
+    Cards are looked up by code, by position in the data file they came from, or as a group
+    by (side_code, type_code, faction_code). Only the cards
+    a process actually uses are built as Cards, once each, so every lookup of a code
+    returns the same instance.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.cache_path = '{}/{}'.format(data_dir, CACHE_FILE)
+        self.mapped = None
+        self._by_file = None
+        self._groups = None
+        # Cards built so far, by index and by code
+        self._cards = None
+        self._by_code = {}
+
+    def load(self):
+        """Maps the cache, first rebuilding it from the card files if they have changed. Does nothing once loaded."""
+        if self.mapped is not None:
+            return self
+        digest = source_digest(self.data_dir)
+        try:
+            mapped = MappedCards(self.cache_path, digest)
+        except (OSError, ValueError, struct.error):
+            by_file = {
+                name: [Card.from_json(c) for c in read_cards_from_file('{}/{}.json'.format(self.data_dir, name))]
+                for name in CARD_FILES
+            }
+            try:
+                write_cache(self.cache_path, digest, by_file)
+            except OSError:
+                # the data directory may be read-only
+                self.cache_path = os.path.join(tempfile.gettempdir(), 'anrdraft-' + CACHE_FILE)
+                write_cache(self.cache_path, digest, by_file)
+            mapped = MappedCards(self.cache_path, digest)
+        self._cards = [None] * len(mapped)
+        self._by_file = {name: CardList(self, indices) for name, indices in mapped.files.items()}
+        # built once from the fixed-width columns, without building any cards
+        groups = {}
+        for index in range(len(mapped)):
+            key = (mapped.fixed('side_code', index), mapped.fixed('type_code', index), mapped.fixed('faction_code', index))
+            groups.setdefault(key, array('I')).append(index)
+        self._groups = {key: CardList(self, indices) for key, indices in groups.items()}
+        self.mapped = mapped
+        return self
+
+    @property
+    def by_file(self):
+        return self.load()._by_file
+
+    def card(self, index):
+        card = self._cards[index]
+        if card is None:
+            card = self._cards[index] = self.mapped.card(index)
+            self._by_code[card.code] = card
+        return card
+
+    def __len__(self):
+        return len(self.load().mapped)
+
+    def __iter__(self):
+        """Every card, which builds them all."""
+        self.load()
+        return (self.card(index) for index in range(len(self.mapped)))
+
+    def __contains__(self, card_code):
+        return self.get(card_code) is not None
+
+    def get(self, card_code):
+        card = self._by_code.get(card_code)
+        if card is None:
+            index = self.load().mapped.find(card_code)
+            if index is not None:
+                card = self.card(index)
+        return card
+
+    def column(self, name, field):
+        """One field of every card from a data file, read without building the cards."""
+        mapped = self.load().mapped
+        return [mapped.value(index, field) for index in mapped.files[name]]
+
+    def group(self, side_code, type_code, faction_code):
+        """The cards of one side, type and faction, in catalog order. Empty if there are none."""
+        group = self.load()._groups.get((side_code, type_code, faction_code))
+        return CardList(self, ()) if group is None else group
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compiles the card files into the cache the bot maps them from.')
+    parser.add_argument('--data', default=os.path.dirname(os.path.abspath(__file__)) + '/data', help='directory holding the card files')
+    args = parser.parse_args()
+    catalog = CardCatalog(args.data).load()
+    print('Cached {} cards in {}'.format(len(catalog), catalog.cache_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+# Discord allows roughly 50 requests per second per bot across all routes.
+GLOBAL_RATE = 50
+GLOBAL_BURST = 50
+MAX_RETRIES = 3
+# Seconds a recipient's worker waits for more messages before shutting down.
+IDLE_TIMEOUT = 60
+
+
+class TokenBucket:
+    """Shared rate limit for every outbound message, refilled continuously."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Dispatcher:
+    """
+    Outbound message scheduler.
+    Each recipient gets their own queue and worker so their messages arrive in order,
+    while different recipients are served concurrently under one global token bucket.
+    """
+
+    def __init__(self, rate=GLOBAL_RATE, burst=GLOBAL_BURST):
+        self.bucket = TokenBucket(rate, burst)
+        self.queues = {}
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def submit(self, recipient, send):
+        """
+        Queues send, a coroutine function taking no arguments, behind anything
+        already queued for recipient. Returns a future for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(recipient)
+        if queue is None:
+            queue = self.queues[recipient] = asyncio.Queue()
+            asyncio.ensure_future(self._worker(recipient, queue))
+        queue.put_nowait((send, future, time.monotonic()))
+        return future
+
+    async def _worker(self, recipient, queue):
+        while True:
+            try:
+                send, future, queued_at = await asyncio.wait_for(queue.get(), IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self.queues[recipient]
+                    return
+                continue
+
+            try:
+                result = await self._send_with_retry(send)
+            except Exception as error:
+                self.failed += 1
+                if not future.cancelled():
+                    future.set_exception(error)
+            else:
+                self.sent += 1
+                if not future.cancelled():
+                    future.set_result(result)
+
+            latency = time.monotonic() - queued_at
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    async def _send_with_retry(self, send):
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                return await send()
+            except Exception as error:
+                # discord.HTTPException carries the status; anything else is not ours to retry
+                if getattr(error, 'status', None) != 429 or attempt >= MAX_RETRIES:
+                    raise
+                attempt += 1
+                self.retried += 1
+                retry_after = getattr(error, 'retry_after', None) or 2 ** attempt
+                if getattr(error, 'is_global', False):
+                    self.bucket.pause(retry_after)
+                else:
+                    # only this recipient's channel is limited, the others carry on
+                    await asyncio.sleep(retry_after)
+
+    def queue_depth(self):
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    def stats(self):
+        completed = self.sent + self.failed
+        return {
+            'queue_depth': self.queue_depth(),
+            'recipients': len(self.queues),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_avg': self.latency_total / completed if completed else 0.0,
+            'latency_max': self.latency_max
+        }
@@ -0,0 +1,131 @@
+import json
+import os
+import random
+from collections import deque
+
+from drafts import (
+    CATALOG, DRAFTS, HERE, PICK_HANDLERS, add_player, get_players, handle_pick,
+    is_bot, open_next_pack_or_wait
+)
+
+# Optional {code: rating} overrides for the computed ratings, e.g. from a community pick order.
+RATINGS_FILE = HERE + '/data/ratings.json'
+
+RATINGS = None
+
+
+def rate_card(card):
+    """
+    A rough, cost-efficiency based rating, higher is better.
+    Good enough for bots to prefer cheap economy and efficient agendas and ice over the rest.
+    """
+    if card.type_code == 'identity':
+        return 1.0
+    if card.type_code == 'agenda':
+        return 3.0 * (card.agenda_points or 0) / max(card.advancement_cost or 1, 1)
+    if card.type_code == 'ice':
+        return 2.0 * ((card.strength or 0) + 1) / ((card.cost or 0) + 1)
+    return 2.0 / ((card.cost or 0) + 1)
+
+
+def get_ratings():
+    """The rating of every card in the catalog, computed on first use."""
+    global RATINGS
+    if RATINGS is None:
+        ratings = {card.code: rate_card(card) for card in CATALOG}
+        if os.path.isfile(RATINGS_FILE):
+            with open(RATINGS_FILE, 'r') as f:
+                ratings.update(json.loads(f.read()))
+        RATINGS = ratings
+    return RATINGS
+
+
+# Strategies choose a card code from a pack, given the bot's player state.
+
+def pick_random(player, pack):
+    return random.choice(pack.codes())
+
+
+def pick_by_rating(player, pack):
+    ratings = get_ratings()
+    return max(pack.codes(), key=lambda code: ratings.get(code, 0))
+
+
+def pick_by_faction(player, pack):
+    """Sticks to the factions already picked, using ratings to choose within them."""
+    ratings = get_ratings()
+    affinity = player.get('affinity', {})
+
+    def score(card):
+        return affinity.get(card.faction_code, 0) + ratings.get(card.code, 0) / 10
+
+    return max(pack, key=score).code
+
+
+STRATEGIES = {
+    'random': pick_random,
+    'faction': pick_by_faction,
+    'rating': pick_by_rating
+}
+DEFAULT_STRATEGY = 'faction'
+
+# Bot ids have room for 99 per draft.
+MAX_BOTS = 20
+
+
+def bot_player_id(draft_id, number):
+    """
+    Bots get negative ids, which no Discord user has, derived from their draft id so
+    they stay unique across restarts.
+    """
+    return -(int(draft_id, 36) * 100 + number)
+
+
+def count_bots(draft_id):
+    return sum(1 for player_id in get_players(draft_id) if is_bot(player_id))
+
+
+def add_bots(draft_id, strategy=DEFAULT_STRATEGY, count=1):
+    """Seats count bots that pick with the named strategy. Returns their names."""
+    number = count_bots(draft_id)
+    names = []
+    for _ in range(count):
+        number += 1
+        name = 'Bot {number} ({strategy})'.format(number=number, strategy=strategy)
+        add_player(name, bot_player_id(draft_id, number), draft_id, strategy=strategy)
+        names.append(name)
+    return names
+
+
+def note_pick(draft_id, player_id, card):
+    if is_bot(player_id):
+        # cards picked per faction, kept with the bot's state so snapshots include it
+        affinity = DRAFTS[draft_id]['players'][player_id].setdefault('affinity', {})
+        affinity[card.faction_code] = affinity.get(card.faction_code, 0) + 1
+
+
+# handle_pick also runs when a restart replays the log, so affinities are rebuilt with it
+PICK_HANDLERS.append(note_pick)
+
+
+def play_bots(draft_id, messages):
+    """
+    Has every bot in the draft pick from each pack the messages open for it, along with any
+    packs those picks pass on to other bots, until only humans are left holding packs.
+    Returns the messages for the humans, in order.
+    """
+    kept = []
+    pending = deque(messages)
+    while pending:
+        player_id, content, pack = pending.popleft()
+        if not is_bot(player_id):
+            kept.append((player_id, content, pack))
+            continue
+        # the draft can finish part way through
+        if pack is None or draft_id not in DRAFTS:
+            continue
+        player = DRAFTS[draft_id]['players'][player_id]
+        card_code = STRATEGIES[player['strategy']](player, player['inbox'][0])
+        card = handle_pick(draft_id, player_id, card_code)
+        pending.extend(open_next_pack_or_wait(draft_id, player_id, card))
+    return kept
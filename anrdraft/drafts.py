@@ -0,0 +1,608 @@
+import asyncio
+import os
+import random
+import string
+
+import metrics
+from catalog import CardCatalog
+from exports import format_text
+from packs import DEFAULT_LAYOUT, Pack, fit_layout, generate_packs
+from pools import compile_pool, load_pool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CATALOG = CardCatalog(HERE + '/data')
+POOL_DIR = HERE + '/data/pools'
+
+# How packs are sent to players:
+#   cards  - one message per card
+#   embeds - up to 10 card embeds per message
+#   list   - a single text listing of titles and codes
+DELIVERY_MODES = ('cards', 'embeds', 'list')
+DEFAULT_DELIVERY = 'embeds'
+
+# Packs go to the player on the left in the first round, then alternate each round.
+ALTERNATE_PASSING = True
+
+# Seconds each player has to make a pick before one is made for them, or None for no limit.
+DEFAULT_PICK_TIME = None
+
+# A draft is snapshotted after this many logged events, which lets the log be compacted.
+SNAPSHOT_INTERVAL = 100
+
+DRAFTS = {}
+PLAYERS = {}
+# creator's user id -> the draft they created. A draft's own 'players' is its member index.
+CREATORS = {}
+DRAFT_LOCKS = {}
+# Set with use_store(); without one nothing is persisted.
+STORE = None
+# Functions called with a player's id and draft id when they join a draft.
+PLAYER_ADDED_HANDLERS = []
+# Functions called with a player's id when they leave a draft or their draft ends.
+PLAYER_REMOVED_HANDLERS = []
+# Functions called with (draft_id, player_id, card) after every pick, including replayed ones.
+PICK_HANDLERS = []
+
+metrics.gauge('drafts', 'Drafts created and not yet finished.', lambda: len(DRAFTS))
+metrics.gauge('players', 'Players in a draft.', lambda: len(PLAYERS))
+metrics.gauge('cards_in_packs', 'Cards in packs still being drafted.', lambda: sum(
+    draft['progress']['cards_remaining'] for draft in DRAFTS.values()
+))
+
+# Getters
+
+def get_draft_id(player_id):
+    return PLAYERS[player_id]['draft_id']
+
+
+def get_seat_number(player_id):
+    draft_id = get_draft_id(player_id)
+    return DRAFTS[draft_id]['players'][player_id]['seat_number']
+
+
+def get_pass_direction(draft_id):
+    metadata = DRAFTS[draft_id]['metadata']
+    # stage is the 1-based pack round once the draft has started
+    if metadata['alternate_passing'] and metadata['stage'] % 2 == 0:
+        return 'right'
+    return 'left'
+
+
+def get_num_players(draft_id):
+    return len(get_players(draft_id))
+
+
+def get_players(draft_id):
+    return DRAFTS[draft_id]['players'].keys()
+
+
+def get_human_players(draft_id):
+    """The players that can be sent DMs."""
+    return [player_id for player_id in get_players(draft_id) if not is_bot(player_id)]
+
+
+def get_creator(draft_id):
+    return DRAFTS[draft_id]['metadata']['creator']
+
+
+def get_pack(draft_id, player_id, pack_num):
+    return DRAFTS[draft_id]['players'][player_id]['packs'][pack_num]
+
+
+def get_picks(draft_id, player_id):
+    return DRAFTS[draft_id]['players'][player_id]['picks']
+
+
+def get_pick_time(draft_id):
+    # drafts saved before pick timers existed have no limit
+    return DRAFTS[draft_id]['metadata'].get('pick_time')
+
+
+def get_draft_lock(draft_id):
+    """
+    Draft state only changes while holding this lock, and never across a DM,
+    so picks in one draft are applied one at a time without holding up other drafts.
+    """
+    lock = DRAFT_LOCKS.get(draft_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        # anyone can name a draft that doesn't exist, so only real drafts' locks are kept
+        if draft_id in DRAFTS:
+            DRAFT_LOCKS[draft_id] = lock
+    return lock
+
+
+def get_card(card_code):
+    return CATALOG.get(card_code)
+
+
+#Checks
+
+def is_player(player_id):
+    if player_id in PLAYERS:
+        return True
+    else:
+        return False
+
+
+def is_bot(player_id):
+    # bots are given negative ids, see drafters.bot_player_id
+    return player_id < 0
+
+
+def player_has_pack_waiting(draft_id, player_id):
+    inbox = DRAFTS[draft_id]['players'][player_id]['inbox']
+    return len(inbox) > 0
+
+
+def player_has_open_pack(draft_id, player_id):
+    return DRAFTS[draft_id]['players'][player_id]['has_open_pack']
+
+
+def draft_finished(draft_id):
+    return DRAFTS[draft_id]['progress']['cards_remaining'] == 0
+
+
+def packs_in_flight(draft_id):
+    return DRAFTS[draft_id]['progress']['packs_in_flight'] > 0
+
+
+def draft_started(draft_id):
+    return DRAFTS[draft_id]['metadata']['has_started']
+
+
+def user_can_create_draft(user_id):
+    # a player's entry in PLAYERS says which draft they are in, so they can only be in one
+    return user_id not in CREATORS and user_id not in PLAYERS
+
+# Draft Setup
+
+def setup_draft(initiating_user_name, initiating_user_id, pool=None, draft_id=None):
+    """Creates a draft, with draft_id as its id if that is given and free, otherwise a random one."""
+    while draft_id is None or draft_id in DRAFTS:
+        draft_id = gen_draft_id()
+    DRAFTS[draft_id] = {
+        'metadata': {
+            'creator': (initiating_user_id, initiating_user_name),
+            'has_started': False,
+            'stage': 0,
+            'alternate_passing': ALTERNATE_PASSING,
+            'seed': random.getrandbits(64),
+            # name of a file in data/pools, or None for every card
+            'pool': pool,
+            'delivery': DEFAULT_DELIVERY,
+            'pick_time': DEFAULT_PICK_TIME
+        },
+        'players': {},
+        'seats': [],
+        # kept up to date on every pick so nothing has to scan all players
+        'progress': {
+            'cards_remaining': 0,
+            'packs_in_flight': 0,
+            # players with a pack in their inbox that hasn't been sent to them yet
+            'waiting': {}
+        }
+    }
+    CREATORS[initiating_user_id] = draft_id
+    add_player(initiating_user_name, initiating_user_id, draft_id)
+    save_snapshot(draft_id)
+    return draft_id
+
+
+def gen_draft_id():
+    code = ''
+    for _ in range(4):
+        total_chars = len(string.ascii_lowercase)
+        index = random.randint(0, total_chars - 1)
+        letter = string.ascii_lowercase[index]
+        code += letter
+    return code
+
+
+def get_pool(draft_id):
+    """The compiled pool the draft deals from, or None if its pool file was removed after the draft was created."""
+    name = DRAFTS[draft_id]['metadata']['pool']
+    if name is None:
+        return compile_pool(CATALOG)
+    definition = load_pool(POOL_DIR, name)
+    return None if definition is None else compile_pool(CATALOG, definition)
+
+
+def pool_problem(draft_id, layout=DEFAULT_LAYOUT):
+    """Why the draft can't be dealt from its pool, or None if it can. Check before begin_draft()."""
+    name = DRAFTS[draft_id]['metadata']['pool']
+    pool = get_pool(draft_id)
+    if pool is None:
+        return 'Card pool `{pool}` no longer exists.'.format(pool=name)
+    num_players = get_num_players(draft_id)
+    if not fit_layout(layout, {file_name: len(indices) for file_name, indices in pool.items()}, num_players):
+        return 'Card pool `{pool}` is too small to deal a pack to each of the {num} players.'.format(pool=name, num=num_players)
+    return None
+
+
+@metrics.timed('setup_packs')
+def setup_packs(draft_id, layout=DEFAULT_LAYOUT):
+    """
+    Deals every seat its packs for the whole draft.
+    The draft's seed makes the deal reproducible.
+    """
+    metadata = DRAFTS[draft_id]['metadata']
+    rng = random.Random('{seed}-packs'.format(seed=metadata['seed']))
+    pool = get_pool(draft_id)
+    if pool is None:
+        raise ValueError('Card pool {} no longer exists.'.format(metadata['pool']))
+    player_ids = list(get_players(draft_id))
+    seats = generate_packs(CATALOG.by_file, pool, len(player_ids), layout, rng)
+
+    for player_id, packs in zip(player_ids, seats):
+        DRAFTS[draft_id]['players'][player_id]['packs'] = packs
+
+    DRAFTS[draft_id]['progress']['cards_remaining'] = sum(
+        len(pack)
+        for packs in seats
+        for pack in packs
+    )
+
+
+def add_player(player_name, player_id, draft_id, strategy=None):
+    """Seats a player. Bots pass the name of their strategy in drafters.STRATEGIES."""
+    player = DRAFTS[draft_id]['players'][player_id] = {
+        'inbox': [],
+        'packs': [],
+        'picks': {
+            'corp': [],
+            'runner': []
+        },
+        'has_open_pack': False
+    }
+    if strategy is not None:
+        player['strategy'] = strategy
+    PLAYERS[player_id] = {
+        'player_name': player_name,
+        'draft_id': draft_id,
+    }
+    for handler in PLAYER_ADDED_HANDLERS:
+        handler(player_id, draft_id)
+    record(draft_id, 'join', player_id=player_id, player_name=player_name, strategy=strategy)
+
+    return 'ADD_SUCCESSFUL'
+
+
+def remove_player(player_id, draft_id):
+    if draft_id not in DRAFTS:
+        return 'Draft `{draft_id}` does not exist.'.format(draft_id=draft_id)
+    if DRAFTS[draft_id]['metadata']['has_started']:
+        return 'Draft `{draft_id}` has already started.'.format(draft_id=draft_id)
+    if player_id not in get_players(draft_id):
+        return 'You were not registered for `{draft_id}`.'.format(draft_id=draft_id)
+    del DRAFTS[draft_id]['players'][player_id]
+    del PLAYERS[player_id]
+    for handler in PLAYER_REMOVED_HANDLERS:
+        handler(player_id)
+    record(draft_id, 'leave', player_id=player_id)
+    return 'ok'
+
+
+def assign_seat_numbers(draft_id):
+    """
+    Seats players in a random order around the table.
+    Each player records who sits to their left and right so passing is a single lookup.
+    """
+    rng = random.Random('{seed}-seats'.format(seed=DRAFTS[draft_id]['metadata']['seed']))
+    seats = list(get_players(draft_id))
+    rng.shuffle(seats)
+    num_players = len(seats)
+    DRAFTS[draft_id]['seats'] = seats
+    for seat_number, player_id in enumerate(seats):
+        player = DRAFTS[draft_id]['players'][player_id]
+        player['seat_number'] = seat_number
+        player['left'] = seats[(seat_number + 1) % num_players]
+        player['right'] = seats[(seat_number - 1) % num_players]
+
+
+def begin_draft(draft_id):
+    setup_packs(draft_id)
+    assign_seat_numbers(draft_id)
+    DRAFTS[draft_id]['metadata']['has_started'] = True
+    record(draft_id, 'start')
+    # the packs are dealt from the pool file as it is now, so keep them rather than replaying the deal
+    save_snapshot(draft_id)
+
+
+def set_delivery_mode(draft_id, mode):
+    DRAFTS[draft_id]['metadata']['delivery'] = mode
+    record(draft_id, 'delivery', mode=mode)
+
+
+def set_pick_time(draft_id, seconds):
+    DRAFTS[draft_id]['metadata']['pick_time'] = seconds
+    record(draft_id, 'timer', seconds=seconds)
+
+
+# Draft Operations
+
+def deal_new_packs(draft_id):
+    """
+    Moves every player's next pack into their inbox and opens it.
+    Returns (player_id, pack) for each pack opened.
+    """
+    DRAFTS[draft_id]['metadata']['stage'] += 1
+    opened = []
+    for player_id in get_players(draft_id):
+        pack = DRAFTS[draft_id]['players'][player_id]['packs'].pop(0)
+        DRAFTS[draft_id]['players'][player_id]['inbox'].append(pack)
+        DRAFTS[draft_id]['players'][player_id]['has_open_pack'] = True
+        opened.append((player_id, pack))
+    DRAFTS[draft_id]['progress']['packs_in_flight'] += len(opened)
+    record(draft_id, 'open')
+    return opened
+
+
+def mark_packs_opened(draft_id):
+    """
+    Opens the pack at the front of every waiting player's inbox.
+    Returns the ids of those players.
+    """
+    waiting = DRAFTS[draft_id]['progress']['waiting']
+    to_open = list(waiting)
+    waiting.clear()
+    for player_id in to_open:
+        DRAFTS[draft_id]['players'][player_id]['has_open_pack'] = True
+    if to_open:
+        record(draft_id, 'opened')
+    return to_open
+
+
+def open_new_pack(draft_id):
+    """
+    Deals the next round of packs and returns the messages that send them to players.
+    After this the pack-sending logic is entirely event-driven.
+    """
+    # packs keep changing as they're picked from, so send a copy
+    return [
+        (player_id, None, tuple(pack))
+        for player_id, pack in deal_new_packs(draft_id)
+    ]
+
+
+@metrics.timed('handle_pick')
+def handle_pick(draft_id, player_id, card_code):
+    """
+    Takes the card from the player's open pack and passes the rest on.
+    Returns the card, or None without changing anything if they have no open pack or it isn't in it.
+    """
+    player = DRAFTS[draft_id]['players'][player_id]
+    if not player['has_open_pack']:
+        return None
+    picked_card = player['inbox'][0].take(card_code)
+    if picked_card is None:
+        return None
+    pack = player['inbox'].pop(0)
+    add_card_to_picks(draft_id, player_id, picked_card)
+    player['has_open_pack'] = False
+
+    progress = DRAFTS[draft_id]['progress']
+    progress['cards_remaining'] -= 1
+    if len(pack) > 0:
+        pass_pack(draft_id, player_id, pack)
+    else:
+        progress['packs_in_flight'] -= 1
+    if player_has_pack_waiting(draft_id, player_id):
+        progress['waiting'][player_id] = True
+    for handler in PICK_HANDLERS:
+        handler(draft_id, player_id, picked_card)
+    record(draft_id, 'pick', player_id=player_id, code=card_code)
+    return picked_card
+
+
+def add_card_to_picks(draft_id, player_id, picked_card):
+    draft = DRAFTS[draft_id]
+    player = draft['players'][player_id]
+    player_picks = player['picks'][picked_card.side_code]
+    player_picks.append(picked_card.code)
+
+
+@metrics.timed('pass_pack')
+def pass_pack(draft_id, player_id, pack):
+    direction = get_pass_direction(draft_id)
+    next_player_id = DRAFTS[draft_id]['players'][player_id][direction]
+    DRAFTS[draft_id]['players'][next_player_id]['inbox'].append(pack)
+    if not player_has_open_pack(draft_id, next_player_id):
+        DRAFTS[draft_id]['progress']['waiting'][next_player_id] = True
+
+
+def open_next_packs(draft_id):
+    return [
+        (player_id, 'Here is your next pack.', tuple(DRAFTS[draft_id]['players'][player_id]['inbox'][0]))
+        for player_id in mark_packs_opened(draft_id)
+    ]
+
+
+@metrics.timed('open_next_pack_or_wait')
+def open_next_pack_or_wait(draft_id, player_id, card):
+    """
+    Moves the draft on after a pick: opens packs for players they've been passed to,
+    then deals the next round or finishes the draft once no packs are left in play.
+    Returns the messages to send.
+    """
+    messages = [(
+        player_id,
+        '{} was picked. A new pack will open once it is passed to you.'.format(card.title),
+        None
+    )]
+    messages.extend(open_next_packs(draft_id))
+
+    if not packs_in_flight(draft_id):
+        if draft_finished(draft_id):
+            for player_id in get_players(draft_id):
+                messages.extend(final_picks_messages(draft_id, player_id))
+            cleanup(draft_id)
+        else:
+            messages.extend(open_new_pack(draft_id))
+    return messages
+
+
+def final_picks_messages(draft_id, player_id):
+    picks = get_picks(draft_id, player_id)
+    return [
+        (player_id, 'The draft is complete! Here are your picks:', None),
+        (player_id, format_picks('Corp:\n\n', picks['corp']), None),
+        (player_id, format_picks('Runner:\n\n', picks['runner']), None)
+    ]
+
+
+def cleanup(draft_id):
+    draft = DRAFTS.pop(draft_id)
+    creator_id, creator_name = draft['metadata']['creator']
+    if CREATORS.get(creator_id) == draft_id:
+        del CREATORS[creator_id]
+    for player_id in draft['players']:
+        del PLAYERS[player_id]
+        for handler in PLAYER_REMOVED_HANDLERS:
+            handler(player_id)
+    DRAFT_LOCKS.pop(draft_id, None)
+    record(draft_id, 'end')
+
+
+def format_picks(heading, picks):
+    """A side's picks, given as card codes, as a deck list. See exports.py for the other formats."""
+    return '```' + heading + format_text([get_card(code) for code in picks]) + '```'
+
+
+# Persistence
+
+def use_store(store):
+    global STORE
+    STORE = store
+
+
+def record(draft_id, kind, **data):
+    """Logs a change to a draft so it can be rebuilt after a restart."""
+    if STORE is not None and STORE.append(draft_id, kind, data) >= SNAPSHOT_INTERVAL:
+        save_snapshot(draft_id)
+
+
+def save_snapshot(draft_id):
+    if STORE is not None:
+        STORE.snapshot(draft_id, encode_draft(draft_id))
+
+
+def encode_card(card):
+    return card.code
+
+
+def encode_full_card(card):
+    return card.as_dict()
+
+
+def encode_draft(draft_id, encode_card=encode_card):
+    """A JSON-safe copy of a draft and its players' entries, with cards reduced to their codes."""
+    draft = DRAFTS[draft_id]
+    players = []
+    for player_id, player in draft['players'].items():
+        state = dict(player)
+        state['packs'] = [[encode_card(card) for card in pack] for pack in player['packs']]
+        state['inbox'] = [[encode_card(card) for card in pack] for pack in player['inbox']]
+        players.append([player_id, state, PLAYERS[player_id]])
+    return {
+        'metadata': draft['metadata'],
+        'seats': draft['seats'],
+        'progress': dict(draft['progress'], waiting=list(draft['progress']['waiting'])),
+        'players': players
+    }
+
+
+def pick_code(pick):
+    """Picks used to be kept as titles, so snapshots from before then have those instead of codes."""
+    if pick in CATALOG:
+        return pick
+    for card in CATALOG:
+        if card.title == pick:
+            return card.code
+    return pick
+
+
+def decode_draft(draft_id, state):
+    players = {}
+    for player_id, player, entry in state['players']:
+        player['packs'] = [Pack(get_card(code) for code in pack) for pack in player['packs']]
+        player['inbox'] = [Pack(get_card(code) for code in pack) for pack in player['inbox']]
+        player['picks'] = {side: [pick_code(pick) for pick in picks] for side, picks in player['picks'].items()}
+        players[player_id] = player
+        PLAYERS[player_id] = entry
+    metadata = state['metadata']
+    metadata['creator'] = tuple(metadata['creator'])
+    CREATORS[metadata['creator'][0]] = draft_id
+    progress = state['progress']
+    progress['waiting'] = dict.fromkeys(progress['waiting'], True)
+    DRAFTS[draft_id] = {
+        'metadata': metadata,
+        'players': players,
+        'seats': state['seats'],
+        'progress': progress
+    }
+
+
+def apply_event(draft_id, kind, data):
+    if kind == 'join':
+        add_player(data['player_name'], data['player_id'], draft_id, data.get('strategy'))
+    elif kind == 'leave':
+        remove_player(data['player_id'], draft_id)
+    elif kind == 'delivery':
+        set_delivery_mode(draft_id, data['mode'])
+    elif kind == 'timer':
+        set_pick_time(draft_id, data['seconds'])
+    elif kind == 'start':
+        begin_draft(draft_id)
+    elif kind == 'open':
+        deal_new_packs(draft_id)
+    elif kind == 'opened':
+        mark_packs_opened(draft_id)
+    elif kind == 'pick':
+        # passing the pack on is part of the pick, so it is not logged separately
+        if handle_pick(draft_id, data['player_id'], data['code']) is None:
+            # only picks that were made are logged, so the packs aren't the ones dealt
+            raise ValueError('Card {} is not in the pack {} was picking from.'.format(data['code'], data['player_id']))
+
+
+def discard_draft(draft_id):
+    """Forgets a draft that couldn't be restored, whatever state it was left in."""
+    DRAFTS.pop(draft_id, None)
+    for player_id, entry in list(PLAYERS.items()):
+        if entry['draft_id'] == draft_id:
+            del PLAYERS[player_id]
+    for creator_id, created in list(CREATORS.items()):
+        if created == draft_id:
+            del CREATORS[creator_id]
+    DRAFT_LOCKS.pop(draft_id, None)
+
+
+def restore_drafts():
+    """
+    Rebuilds every in-flight draft from its latest snapshot plus the events logged since.
+    A draft that can't be rebuilt is reported and ended, so the others still come back.
+    Returns the ids of the drafts restored.
+    """
+    snapshots, events = STORE.load()
+    failed = {}
+    STORE.replaying = True
+    try:
+        for draft_id, (seq, state) in snapshots.items():
+            try:
+                decode_draft(draft_id, state)
+            except Exception as error:
+                failed[draft_id] = error
+        for draft_id, kind, data in events:
+            if draft_id in failed:
+                continue
+            try:
+                apply_event(draft_id, kind, data)
+            except Exception as error:
+                failed[draft_id] = error
+    finally:
+        STORE.replaying = False
+    for draft_id, error in failed.items():
+        print('Could not restore draft {}, ending it. {}: {}'.format(draft_id, type(error).__name__, error))
+        discard_draft(draft_id)
+        record(draft_id, 'end')
+    return [draft_id for draft_id in snapshots if draft_id not in failed]
@@ -0,0 +1,130 @@
+"""
+Deck lists from a player's picks, in the formats other Netrunner tools import.
+
+Picks are card codes. Everything here works on Cards already looked up by the caller, with
+no draft state, so exports can be rendered in an executor thread.
+"""
+
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+EXPORT_FORMATS = ('text', 'json', 'o8d')
+
+# Picking an identity gets one copy of it and picking any other card gets a playset.
+IDENTITY_COPIES = 1
+CARD_COPIES = 3
+
+# Sections in the order NetrunnerDB lists them, anything else goes after.
+TYPE_ORDER = (
+    'agenda', 'asset', 'upgrade', 'operation', 'ice',
+    'event', 'hardware', 'resource', 'program'
+)
+
+OCTGN_GAME_ID = '0f38e453-26df-4c04-9d67-6d43de939c77'
+# OCTGN card ids are this followed by the NetrunnerDB code.
+OCTGN_CARD_PREFIX = 'bc0f047c-01b1-427f-a439-d451eda'
+
+
+def aggregate(cards):
+    """
+    Counts the copies of each card in one pass over the picks.
+    Returns (identities, cards), each a list of (card, copies) in the order first picked.
+    """
+    counts = {}
+    for card in cards:
+        entry = counts.get(card.code)
+        if entry is None:
+            counts[card.code] = [card, 1]
+        else:
+            entry[1] += 1
+    identities = []
+    deck = []
+    for card, picked in counts.values():
+        if card.type_code == 'identity':
+            identities.append((card, picked * IDENTITY_COPIES))
+        else:
+            deck.append((card, picked * CARD_COPIES))
+    return identities, deck
+
+
+def type_sections(deck):
+    """The deck's cards grouped by type, as (type_code, [(card, copies)]), each sorted by title."""
+    by_type = {}
+    for card, copies in deck:
+        by_type.setdefault(card.type_code, []).append((card, copies))
+
+    def order(type_code):
+        if type_code in TYPE_ORDER:
+            return (TYPE_ORDER.index(type_code), type_code)
+        return (len(TYPE_ORDER), type_code)
+
+    return [
+        (type_code, sorted(by_type[type_code], key=lambda entry: entry[0].title))
+        for type_code in sorted(by_type, key=order)
+    ]
+
+
+def format_text(cards):
+    """One side's picks as NetrunnerDB's plain text deck list, which jinteki.net imports too."""
+    identities, deck = aggregate(cards)
+    lines = ['{}x {}'.format(copies, card.title) for card, copies in identities]
+    for type_code, entries in type_sections(deck):
+        lines.append('')
+        lines.append('{} ({})'.format(type_code.title(), sum(copies for card, copies in entries)))
+        lines.extend('{}x {}'.format(copies, card.title) for card, copies in entries)
+    return '\n'.join(lines)
+
+
+def format_json(sides):
+    """Both sides' picks as JSON, with each card's code, title, type and copies."""
+    exported = {}
+    for side, cards in sides.items():
+        identities, deck = aggregate(cards)
+        exported[side] = {
+            'identities': [
+                {'code': card.code, 'title': card.title, 'copies': copies}
+                for card, copies in identities
+            ],
+            'cards': [
+                {'code': card.code, 'title': card.title, 'type': card.type_code, 'copies': copies}
+                for type_code, entries in type_sections(deck)
+                for card, copies in entries
+            ]
+        }
+    return json.dumps(exported, indent=2, ensure_ascii=False)
+
+
+def format_o8d(cards):
+    """One side's picks as an OCTGN deck file. Every identity picked is included, OCTGN asks which to play."""
+    identities, deck = aggregate(cards)
+
+    def card_lines(entries):
+        return [
+            '    <card qty="{}" id="{}{}">{}</card>'.format(copies, OCTGN_CARD_PREFIX, card.code, escape(card.title))
+            for card, copies in entries
+        ]
+
+    lines = [
+        '<?xml version="1.0" encoding="utf-8" standalone="yes"?>',
+        '<deck game={}>'.format(quoteattr(OCTGN_GAME_ID)),
+        '  <section name="Identity" shared="False">'
+    ]
+    lines.extend(card_lines(identities))
+    lines.append('  </section>')
+    lines.append('  <section name="R&amp;D / Stack" shared="False">')
+    lines.extend(card_lines([entry for type_code, entries in type_sections(deck) for entry in entries]))
+    lines.append('  </section>')
+    lines.append('</deck>')
+    return '\n'.join(lines) + '\n'
+
+
+def export_files(export_format, name, sides):
+    """
+    Renders picks as (filename, text) pairs, one file per side except for JSON.
+    sides maps 'corp' and 'runner' to the Cards picked for each.
+    """
+    if export_format == 'json':
+        return [('{}.json'.format(name), format_json(sides))]
+    if export_format == 'o8d':
+        return [('{}-{}.o8d'.format(name, side), format_o8d(cards)) for side, cards in sides.items()]
+    return [('{}-{}.txt'.format(name, side), format_text(cards)) for side, cards in sides.items()]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+Load test for the bot's command handlers.
+
+Runs the real commands (create, join, start, pick) for many virtual users against
+transport.LocalTransport instead of Discord, so no network or token is needed.
+
+    python loadtest.py --drafts 25 --players 8 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import anrdraft
+from drafts import DRAFTS, get_draft_id, is_player
+from transport import LocalContext, LocalTransport
+
+
+async def invoke(command, ctx, *args):
+    # bot.command() wraps the handler in a Command, the function itself is its callback
+    callback = getattr(command, 'callback', command)
+    await callback(ctx, *args)
+
+
+async def virtual_player(transport, ctx, rng):
+    """Picks a random card every time a pack is open, until the draft ends."""
+    player_id = ctx.author.id
+    arrived = transport.message_event(player_id)
+    picks = 0
+    while is_player(player_id):
+        player = DRAFTS[get_draft_id(player_id)]['players'][player_id]
+        if player['has_open_pack']:
+            card_code = rng.choice(player['inbox'][0].codes())
+            await invoke(anrdraft.pick, ctx, card_code)
+            picks += 1
+        else:
+            await arrived.wait()
+            arrived.clear()
+    return picks
+
+
+async def run_draft(transport, first_player_id, num_players, rng):
+    contexts = [
+        LocalContext(transport, player_id, 'user-{}'.format(player_id))
+        for player_id in range(first_player_id, first_player_id + num_players)
+    ]
+    creator = contexts[0]
+    await invoke(anrdraft.create_draft, creator)
+    draft_id = get_draft_id(creator.author.id)
+    for ctx in contexts[1:]:
+        await invoke(anrdraft.join_draft, ctx, draft_id)
+    await invoke(anrdraft.start_draft, creator)
+
+    results = await asyncio.gather(*(virtual_player(transport, ctx, rng) for ctx in contexts))
+    return sum(results)
+
+
+async def load_test(args):
+    transport = LocalTransport(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        error_rate=args.error_rate,
+        rng=random.Random(args.seed)
+    )
+    anrdraft.use_transport(transport)
+    anrdraft.DISPATCHER.bucket.rate = args.global_rate
+    anrdraft.DISPATCHER.bucket.capacity = args.global_rate
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_draft(transport, i * args.players + 1, args.players, rng)
+        for i in range(args.drafts)
+    ))
+    elapsed = time.perf_counter() - started
+    return sum(results), elapsed, transport
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the bot commands against a local Discord stand-in.')
+    parser.add_argument('--drafts', type=int, default=10, help='number of concurrent drafts')
+    parser.add_argument('--players', type=int, default=8, help='virtual users in each draft')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds per request')
+    parser.add_argument('--rate-limit', type=int, default=None, help='messages per channel per window before a 429')
+    parser.add_argument('--rate-window', type=float, default=5.0, help='seconds in a rate limit window')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of sends that fail with a 429')
+    parser.add_argument('--global-rate', type=float, default=1000, help='requests per second allowed by the dispatcher')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    picks, elapsed, transport = asyncio.run(load_test(args))
+    stats = anrdraft.DISPATCHER.stats()
+
+    print('users:           {} ({} drafts x {})'.format(args.drafts * args.players, args.drafts, args.players))
+    print('picks:           {}'.format(picks))
+    print('elapsed:         {:.3f} s'.format(elapsed))
+    print('picks/sec:       {:.0f}'.format(picks / elapsed))
+    print('messages sent:   {}'.format(transport.sent))
+    print('429 responses:   {}'.format(transport.rate_limited))
+    print('send retries:    {}'.format(stats['retried']))
+    print('send failures:   {}'.format(stats['failed']))
+    print('send latency:    {:.3f} s avg, {:.3f} s max'.format(stats['latency_avg'], stats['latency_max']))
+
+
+if __name__ == '__main__':
+    main()
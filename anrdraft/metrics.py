@@ -0,0 +1,201 @@
+import asyncio
+import functools
+import os
+import time
+from bisect import bisect_left
+
+# Instrumentation is switched on with ANRDRAFT_METRICS=1. It is decided when the
+# decorated functions are defined, so with it off they are left exactly as they are.
+ENABLED = os.environ.get('ANRDRAFT_METRICS', '') not in ('', '0')
+# Set ANRDRAFT_METRICS_PORT as well to serve Prometheus text on 127.0.0.1.
+PORT = int(os.environ.get('ANRDRAFT_METRICS_PORT', 0)) or None
+
+# Upper bounds in seconds, from a fast pick to a DM stuck behind a rate limit.
+BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10
+)
+
+HISTOGRAMS = {}
+COUNTERS = {}
+# name -> (help, function returning the current value)
+GAUGES = {}
+
+
+class Histogram:
+    """Call count, total and max time, and counts per bucket of how long a call took."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, fraction):
+        """Estimated as the upper bound of the bucket the quantile falls in."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+def histogram(name):
+    found = HISTOGRAMS.get(name)
+    if found is None:
+        found = HISTOGRAMS[name] = Histogram(name)
+    return found
+
+
+def increment(name, amount=1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + amount
+
+
+def gauge(name, description, read):
+    """Registers read, a function of no arguments, to be called whenever stats are shown."""
+    GAUGES[name] = (description, read)
+
+
+def timed(name):
+    """
+    Decorator recording each call's duration in the named histogram and counting the calls
+    that raise. Works on plain and async functions. Does nothing when metrics are disabled.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        observe = histogram(name).observe
+        errors = name + '_errors'
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    increment(errors)
+                    raise
+                finally:
+                    observe(time.perf_counter() - started)
+            return timed_async
+
+        @functools.wraps(func)
+        def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                increment(errors)
+                raise
+            finally:
+                observe(time.perf_counter() - started)
+        return timed_call
+
+    return decorator
+
+
+def read_gauges():
+    values = {}
+    for name, (description, read) in GAUGES.items():
+        try:
+            values[name] = read()
+        except Exception:
+            # a gauge must never break the stats it's shown with
+            values[name] = None
+    return values
+
+
+def format_duration(seconds):
+    if seconds < 0.001:
+        return '{:.0f}us'.format(seconds * 1e6)
+    if seconds < 1:
+        return '{:.1f}ms'.format(seconds * 1e3)
+    return '{:.2f}s'.format(seconds)
+
+
+def summary():
+    """Plain text for the !stats command."""
+    lines = []
+    for name, value in sorted(read_gauges().items()):
+        lines.append('{:<24} {}'.format(name, 'error' if value is None else value))
+    for name, value in sorted(COUNTERS.items()):
+        lines.append('{:<24} {}'.format(name, value))
+    if not ENABLED:
+        lines.append('Timings are off. Start the bot with ANRDRAFT_METRICS=1 to record them.')
+    elif HISTOGRAMS:
+        lines.append('')
+        lines.append('{:<24} {:>8} {:>9} {:>9} {:>9} {:>9}'.format('timing', 'calls', 'avg', 'p50', 'p99', 'max'))
+        for name, found in sorted(HISTOGRAMS.items()):
+            lines.append('{:<24} {:>8} {:>9} {:>9} {:>9} {:>9}'.format(
+                name,
+                found.count,
+                format_duration(found.total / found.count if found.count else 0),
+                format_duration(found.quantile(0.5)),
+                format_duration(found.quantile(0.99)),
+                format_duration(found.max)
+            ))
+    return '\n'.join(lines)
+
+
+def prometheus_text():
+    """Everything in the Prometheus text exposition format, prefixed with anrdraft_."""
+    lines = []
+    for name, value in sorted(read_gauges().items()):
+        if value is None:
+            continue
+        lines.append('# HELP anrdraft_{} {}'.format(name, GAUGES[name][0]))
+        lines.append('# TYPE anrdraft_{} gauge'.format(name))
+        lines.append('anrdraft_{} {}'.format(name, value))
+    for name, value in sorted(COUNTERS.items()):
+        lines.append('# TYPE anrdraft_{}_total counter'.format(name))
+        lines.append('anrdraft_{}_total {}'.format(name, value))
+    for name, found in sorted(HISTOGRAMS.items()):
+        metric = 'anrdraft_{}_seconds'.format(name)
+        lines.append('# TYPE {} histogram'.format(metric))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, found.counts):
+            cumulative += count
+            lines.append('{}_bucket{{le="{}"}} {}'.format(metric, bound, cumulative))
+        lines.append('{}_bucket{{le="+Inf"}} {}'.format(metric, found.count))
+        lines.append('{}_sum {}'.format(metric, found.total))
+        lines.append('{}_count {}'.format(metric, found.count))
+    return '\n'.join(lines) + '\n'
+
+
+async def _serve_scrape(reader, writer):
+    try:
+        # only one page is served, so the request itself doesn't matter
+        await reader.readuntil(b'\r\n\r\n')
+        body = prometheus_text().encode()
+        writer.write(
+            b'HTTP/1.0 200 OK\r\n'
+            b'Content-Type: text/plain; version=0.0.4\r\n'
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(port=PORT, host='127.0.0.1'):
+    """Serves prometheus_text() over HTTP. Returns the asyncio server, or None without a port."""
+    if not port:
+        return None
+    return await asyncio.start_server(_serve_scrape, host, port)
@@ -0,0 +1,97 @@
+import random
+from collections import Counter
+
+
+def standard_layout(card_packs=3, pack_size=15, id_pack_size=5):
+    """
+    The packs each seat gets, in the order they're opened, as (pool name, cards per pack).
+    Corp first, then runner, each side starting with a pack of identities.
+    """
+    layout = []
+    for side in ('corp', 'runner'):
+        layout.append((side + '_ids', id_pack_size))
+        layout.extend([(side + '_cards', pack_size)] * card_packs)
+    return tuple(layout)
+
+
+DEFAULT_LAYOUT = standard_layout()
+
+
+class Pack:
+    """
+    The cards left in a pack, in the order they were dealt, with each card's slot indexed by its code.
+    Taking a card empties its slot rather than shifting the cards after it, so a pick is O(1).
+    """
+    __slots__ = ('cards', 'slots')
+
+    def __init__(self, cards):
+        self.cards = list(cards)
+        self.slots = {card.code: slot for slot, card in enumerate(self.cards)}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        # taken slots hold None, and a card is never falsy
+        return filter(None, self.cards)
+
+    def __contains__(self, card_code):
+        return card_code in self.slots
+
+    def codes(self):
+        return list(self.slots)
+
+    def take(self, card_code):
+        """Removes and returns the card with this code. Returns None, changing nothing, if it isn't here."""
+        slot = self.slots.pop(card_code, None)
+        if slot is None:
+            return None
+        card = self.cards[slot]
+        self.cards[slot] = None
+        return card
+
+
+def fit_layout(layout, pool_sizes, num_seats):
+    """
+    Shrinks the packs drawn from any pool too small for every seat to get a full set,
+    so each seat still gets the same number of cards per pack. Packs that would be empty are dropped.
+    """
+    packs_per_pool = Counter(name for name, _ in layout)
+    demand = Counter()
+    for name, size in layout:
+        demand[name] += size * num_seats
+
+    fitted = []
+    for name, size in layout:
+        if demand[name] > pool_sizes[name]:
+            size = min(size, pool_sizes[name] // (num_seats * packs_per_pool[name]))
+        if size > 0:
+            fitted.append((name, size))
+    return tuple(fitted)
+
+
+def generate_packs(cards, pool, num_seats, layout=DEFAULT_LAYOUT, rng=random):
+    """
+    Deals every pack for every seat in one pass.
+    cards maps a card file name to its list of cards and pool maps the same names to the
+    indices into those lists that can be dealt (see pools.compile_pool). Each pool is sampled
+    once, without replacement, for all the cards it has to supply; packs are then cut from
+    that sample. Returns one list of Packs per seat.
+    """
+    layout = fit_layout(layout, {name: len(indices) for name, indices in pool.items()}, num_seats)
+
+    demand = Counter()
+    for name, size in layout:
+        demand[name] += size * num_seats
+    draws = {
+        name: iter(rng.sample(pool[name], count))
+        for name, count in demand.items()
+    }
+
+    seats = [[] for _ in range(num_seats)]
+    for name, size in layout:
+        file_cards = cards[name]
+        draw = draws[name]
+        for seat in seats:
+            seat.append(Pack(file_cards[next(draw)] for _ in range(size)))
+    return seats
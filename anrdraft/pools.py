@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+from array import array
+
+# A pool definition restricts a draft to part of the catalog, e.g. a cube:
+#   codes    - card codes to include
+#   packs    - pack codes whose cards are included
+#   factions - faction codes whose cards are included
+# A card is in the pool if it matches any of these. A definition with none of them is the whole catalog.
+POOL_KEYS = ('codes', 'packs', 'factions')
+
+_COMPILED = {}
+
+
+def pool_names(pool_dir):
+    if not os.path.isdir(pool_dir):
+        return []
+    return sorted(name[:-len('.json')] for name in os.listdir(pool_dir) if name.endswith('.json'))
+
+
+def load_pool(pool_dir, name):
+    """
+    Reads data/pools/<name>.json. Returns None if there is no such pool or it isn't a definition.
+    The name comes from users, so only the pools pool_names lists are read, never another path.
+    """
+    if name not in pool_names(pool_dir):
+        return None
+    filepath = os.path.join(pool_dir, name + '.json')
+    if not os.path.isfile(filepath):
+        return None
+    with open(filepath, 'r') as f:
+        try:
+            definition = json.loads(f.read())
+        except ValueError:
+            definition = None
+    if not isinstance(definition, dict):
+        print('Card pool {} is not a JSON object of {}.'.format(name, ', '.join(POOL_KEYS)))
+        return None
+    return definition
+
+
+def pool_hash(definition):
+    normalized = {key: sorted(definition.get(key) or []) for key in POOL_KEYS}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def compile_pool(catalog, definition=None):
+    """
+    Filters the catalog down to a pool once, as an array of indices into each card file.
+    Compiled pools are cached by the hash of their definition, so every draft using the
+    same pool shares one copy. The whole catalog is just a range per file.
+    """
+    definition = definition or {}
+    key = pool_hash(definition)
+    pool = _COMPILED.get(key)
+    if pool is not None:
+        return pool
+
+    codes = set(definition.get('codes') or [])
+    packs = set(definition.get('packs') or [])
+    factions = set(definition.get('factions') or [])
+
+    pool = {}
+    for name, cards in catalog.by_file.items():
+        if not (codes or packs or factions):
+            pool[name] = range(len(cards))
+        else:
+            # straight from the catalog's columns, without building every card
+            pool[name] = array('I', (
+                i for i, (code, pack_code, faction_code) in enumerate(zip(
+                    catalog.column(name, 'code'),
+                    catalog.column(name, 'pack_code'),
+                    catalog.column(name, 'faction_code')
+                ))
+                if code in codes or pack_code in packs or faction_code in factions
+            ))
+    _COMPILED[key] = pool
+    return pool
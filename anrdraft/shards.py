@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+
+"""
+Where draft actions run.
+
+LocalRouter runs them in the bot's own process. ShardRouter spreads drafts over worker
+processes, each running this file: a draft lives in the worker its id hashes to, and the
+bot process forwards each command for it there over a socket, then sends the DMs it gets
+back. Workers keep their own state database and push the DMs from pick timers themselves.
+
+    python anrdraft.py --shards 4
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import pickle
+import socket
+import struct
+import subprocess
+import sys
+import traceback
+import zlib
+
+import actions
+from drafts import (
+    DRAFTS, PLAYERS, PLAYER_ADDED_HANDLERS, PLAYER_REMOVED_HANDLERS, gen_draft_id,
+    get_card, is_bot, restore_drafts, use_store
+)
+from store import DraftStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Every frame is a pickle preceded by its length.
+HEADER = struct.Struct('!I')
+
+
+def shard_for(draft_id, num_shards):
+    # crc32 rather than hash(), which is salted differently in every process
+    return zlib.crc32(draft_id.encode('utf-8')) % num_shards
+
+
+async def read_frame(reader):
+    size, = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def write_frame(writer, frame):
+    data = pickle.dumps(frame, pickle.HIGHEST_PROTOCOL)
+    writer.write(HEADER.pack(len(data)) + data)
+
+
+def encode_messages(messages):
+    # every process has the catalog, so packs only need their card codes
+    return [
+        (player_id, content, None if pack is None else tuple(card.code for card in pack))
+        for player_id, content, pack in messages
+    ]
+
+
+def decode_messages(messages):
+    return [
+        (player_id, content, None if pack is None else tuple(get_card(code) for code in pack))
+        for player_id, content, pack in messages
+    ]
+
+
+class LocalRouter:
+    """Runs actions on the drafts in this process."""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.started = False
+
+    def draft_of(self, player_id):
+        entry = PLAYERS.get(player_id)
+        return None if entry is None else entry['draft_id']
+
+    async def call(self, draft_id, action, *args):
+        return await actions.ACTIONS[action](draft_id, *args)
+
+    async def create(self, user_name, user_id, pool=None):
+        return await actions.create(user_name, user_id, pool)
+
+    async def draft_ids(self):
+        return list(DRAFTS)
+
+    async def start(self):
+        """Resumes drafts restored from the store. Call once the bot can send DMs."""
+        self.started = True
+        if self.store is not None:
+            self.store.start()
+        await asyncio.gather(*(
+            actions.DELIVER(messages, delivery)
+            for messages, delivery in actions.resume_drafts()
+        ))
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+class ShardRouter:
+    """
+    Runs actions in num_shards worker processes.
+    Keeps its own copy of which draft each player is in, updated by every frame from the
+    workers, so a command is routed without asking them. deliver(messages, delivery) sends
+    the DMs from work the shards do on their own, and player_removed(player_id) is called
+    for everyone who leaves a draft.
+    """
+
+    def __init__(self, num_shards, state_path, deliver, player_removed):
+        self.num_shards = num_shards
+        # formatted with each shard's number
+        self.state_path = state_path
+        self.deliver = deliver
+        self.player_removed = player_removed
+        self.routes = {}
+        self.processes = []
+        self.sockets = []
+        self.writers = []
+        self.pending = {}
+        # shards whose worker has exited, their drafts can't be reached until the bot restarts
+        self.stopped = set()
+        self.calls = itertools.count()
+        self.next_shard = itertools.cycle(range(num_shards))
+        self.started = False
+
+    def draft_of(self, player_id):
+        return self.routes.get(player_id)
+
+    async def call(self, draft_id, action, *args):
+        return await self._call(shard_for(draft_id, self.num_shards), action, (draft_id,) + args)
+
+    async def create(self, user_name, user_id, pool=None):
+        draft_id = self.routes.get(user_id)
+        if draft_id is None:
+            # the shard picks an id that hashes to itself
+            shard = next(self.next_shard)
+        else:
+            # the shard with the draft they're already in turns them down
+            shard = shard_for(draft_id, self.num_shards)
+        return await self._call(shard, 'create', (user_name, user_id, pool))
+
+    async def draft_ids(self):
+        found = await asyncio.gather(*(
+            self._call(shard, 'draft_ids', ())
+            for shard in range(self.num_shards)
+        ))
+        return [draft_id for ids in found for draft_id in ids]
+
+    async def _call(self, shard, action, args):
+        if shard in self.stopped:
+            raise RuntimeError('Shard {} stopped.'.format(shard))
+        call_id = next(self.calls)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[call_id] = (shard, future)
+        write_frame(self.writers[shard], (call_id, action, args))
+        result = await future
+        # actions return (reply, messages, delivery), queries anything else
+        if isinstance(result, tuple):
+            reply, messages, delivery = result
+            result = reply, decode_messages(messages), delivery
+        return result
+
+    async def start(self):
+        self.started = True
+        for shard in range(self.num_shards):
+            ours, theirs = socket.socketpair()
+            self.processes.append(subprocess.Popen(
+                [
+                    sys.executable, os.path.join(HERE, 'shards.py'),
+                    str(shard), str(self.num_shards), self.state_path.format(shard=shard), str(theirs.fileno())
+                ],
+                pass_fds=(theirs.fileno(),)
+            ))
+            theirs.close()
+            reader, writer = await asyncio.open_connection(sock=ours)
+            self.sockets.append(ours)
+            self.writers.append(writer)
+            asyncio.ensure_future(self._listen(shard, reader))
+
+    async def _listen(self, shard, reader):
+        while True:
+            try:
+                frame = await read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                print('Shard {} stopped.'.format(shard))
+                self.stopped.add(shard)
+                for call_id, (call_shard, future) in list(self.pending.items()):
+                    if call_shard == shard:
+                        del self.pending[call_id]
+                        future.set_exception(RuntimeError('Shard {} stopped.'.format(shard)))
+                return
+
+            self._apply_changes(frame[-1])
+            if frame[0] == 'reply':
+                _, call_id, ok, result, changes = frame
+                _, future = self.pending.pop(call_id)
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(result))
+            elif frame[1]:
+                _, messages, delivery, changes = frame
+                asyncio.ensure_future(self.deliver(decode_messages(messages), delivery))
+
+    def _apply_changes(self, changes):
+        for change, player_id, draft_id in changes:
+            if change == 'join':
+                self.routes[player_id] = draft_id
+            elif self.routes.get(player_id) == draft_id:
+                del self.routes[player_id]
+                self.player_removed(player_id)
+
+    def close(self):
+        """Closing the sockets tells the workers to save their state and exit."""
+        for sock in self.sockets:
+            sock.close()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+# Worker
+
+def new_draft_id(shard, num_shards):
+    draft_id = gen_draft_id()
+    while draft_id in DRAFTS or shard_for(draft_id, num_shards) != shard:
+        draft_id = gen_draft_id()
+    return draft_id
+
+
+async def serve_shard(shard, num_shards, sock, store):
+    """Runs actions sent by the bot process until it closes the socket."""
+    # membership changes, sent to the bot with the next frame in the order they happened
+    changes = []
+    routes = {}
+
+    def note_added(player_id, draft_id):
+        if not is_bot(player_id):
+            routes[player_id] = draft_id
+            changes.append(('join', player_id, draft_id))
+
+    def note_removed(player_id):
+        draft_id = routes.pop(player_id, None)
+        if draft_id is not None:
+            changes.append(('leave', player_id, draft_id))
+
+    def take_changes():
+        taken = changes[:]
+        changes.clear()
+        return taken
+
+    PLAYER_ADDED_HANDLERS.append(note_added)
+    PLAYER_REMOVED_HANDLERS.append(note_removed)
+    for player_id, entry in list(PLAYERS.items()):
+        note_added(player_id, entry['draft_id'])
+
+    reader, writer = await asyncio.open_connection(sock=sock)
+
+    async def push(messages, delivery):
+        write_frame(writer, ('push', encode_messages(messages), delivery, take_changes()))
+
+    async def handle(call_id, action, args):
+        try:
+            if action == 'create':
+                args = args + (new_draft_id(shard, num_shards),)
+            result = await actions.ACTIONS[action](*args)
+            if isinstance(result, tuple):
+                reply, messages, delivery = result
+                result = reply, encode_messages(messages), delivery
+            frame = ('reply', call_id, True, result, take_changes())
+        except Exception as error:
+            traceback.print_exc()
+            frame = ('reply', call_id, False, '{}: {}'.format(type(error).__name__, error), take_changes())
+        write_frame(writer, frame)
+
+    actions.use_deliver(push)
+    store.start()
+    for messages, delivery in actions.resume_drafts():
+        await push(messages, delivery)
+    # anything restored that had no pack to resend
+    await push([], None)
+
+    running = set()
+    while True:
+        try:
+            call_id, action, args = await read_frame(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            break
+        task = asyncio.ensure_future(handle(call_id, action, args))
+        running.add(task)
+        task.add_done_callback(running.discard)
+    if running:
+        await asyncio.wait(running)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A draft worker process, started by anrdraft.py --shards.')
+    parser.add_argument('shard', type=int)
+    parser.add_argument('num_shards', type=int)
+    parser.add_argument('state_db')
+    parser.add_argument('fd', type=int, help='socket connected to the bot process')
+    args = parser.parse_args()
+
+    store = DraftStore(args.state_db)
+    use_store(store)
+    restore_drafts()
+    try:
+        asyncio.run(serve_shard(args.shard, args.num_shards, socket.socket(fileno=args.fd), store))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import random
+import time
+
+from drafters import add_bots, play_bots
+from drafts import (
+    DRAFTS, add_player, begin_draft, get_draft_lock, handle_pick,
+    open_new_pack, open_next_pack_or_wait, setup_draft
+)
+
+
+class RecordingTransport:
+    """
+    Stands in for Discord when running drafts headless.
+    Counts the messages draft operations produce instead of sending them,
+    optionally waiting a fixed time per delivery to mimic the network.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = 0
+        self.packs = 0
+
+    async def deliver(self, messages, delivery):
+        self.messages += len(messages)
+        self.packs += sum(1 for _, _, pack in messages if pack is not None)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+async def simulate_draft(num_players, transport, first_player_id=1, rng=random, pick_latencies=None, num_bots=0):
+    """
+    Runs one draft from creation to the last pick with every seat picking a random card,
+    plus num_bots seats taken by bot drafters.
+    Players pick in a random order among those with an open pack, one pick at a time.
+    The time taken by each pick's state changes, including any bot picks it sets off,
+    is appended to pick_latencies. Returns the number of picks made by players.
+    """
+    draft_id = setup_draft('player-{}'.format(first_player_id), first_player_id)
+    for player_id in range(first_player_id + 1, first_player_id + num_players):
+        add_player('player-{}'.format(player_id), player_id, draft_id)
+    if num_bots:
+        add_bots(draft_id, count=num_bots)
+
+    async with get_draft_lock(draft_id):
+        begin_draft(draft_id)
+        messages = play_bots(draft_id, open_new_pack(draft_id))
+        delivery = DRAFTS[draft_id]['metadata']['delivery']
+    await transport.deliver(messages, delivery)
+
+    picks = 0
+    while draft_id in DRAFTS:
+        players = DRAFTS[draft_id]['players']
+        ready = [player_id for player_id, player in players.items() if player['has_open_pack']]
+        player_id = rng.choice(ready)
+        card_code = rng.choice(players[player_id]['inbox'][0].codes())
+
+        started = time.perf_counter()
+        async with get_draft_lock(draft_id):
+            card = handle_pick(draft_id, player_id, card_code)
+            messages = play_bots(draft_id, open_next_pack_or_wait(draft_id, player_id, card))
+        if pick_latencies is not None:
+            pick_latencies.append(time.perf_counter() - started)
+        picks += 1
+
+        await transport.deliver(messages, delivery)
+    return picks
+
+
+async def simulate(num_drafts, num_players, transport, seed=None, pick_latencies=None, num_bots=0):
+    """Runs num_drafts drafts concurrently. Returns the total number of picks made by players."""
+    if seed is not None:
+        # draft ids and seeds come from the module-level RNG
+        random.seed(seed)
+    rng = random.Random(seed)
+    results = await asyncio.gather(*(
+        simulate_draft(num_players, transport, i * num_players + 1, rng, pick_latencies, num_bots)
+        for i in range(num_drafts)
+    ))
+    return sum(results)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds between flushes of buffered writes to disk.
+FLUSH_INTERVAL = 0.5
+# Flush early once this many writes are waiting.
+FLUSH_BATCH = 500
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS events ('
+    ' seq INTEGER PRIMARY KEY, draft_id TEXT NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS events_by_draft ON events (draft_id, seq)',
+    'CREATE TABLE IF NOT EXISTS snapshots ('
+    ' draft_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, state TEXT NOT NULL)',
+)
+
+
+class DraftStore:
+    """
+    Append-only event log plus per-draft snapshots, kept in SQLite in WAL mode.
+
+    Writes are buffered in memory and committed in batches from a single writer thread,
+    so recording an event never waits on the disk. A snapshot replaces everything logged
+    for its draft before it; an 'end' event removes the draft from the store entirely.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self.pending = []
+        self.since_snapshot = {}
+        self.replaying = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.flusher = None
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=FULL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def load(self):
+        """
+        Reads everything needed to rebuild in-flight drafts.
+        Returns the latest snapshot of each draft as {draft_id: (seq, state)} and
+        the events logged after those snapshots as [(draft_id, kind, data)], oldest first.
+        """
+        snapshots = {}
+        for draft_id, seq, state in self.connection.execute('SELECT draft_id, seq, state FROM snapshots'):
+            snapshots[draft_id] = (seq, json.loads(state))
+
+        events = []
+        rows = self.connection.execute('SELECT seq, draft_id, kind, data FROM events ORDER BY seq')
+        for seq, draft_id, kind, data in rows:
+            self.seq = max(self.seq, seq)
+            if draft_id in snapshots and seq > snapshots[draft_id][0]:
+                events.append((draft_id, kind, json.loads(data)))
+                self.since_snapshot[draft_id] = self.since_snapshot.get(draft_id, 0) + 1
+        for seq, _ in snapshots.values():
+            self.seq = max(self.seq, seq)
+        return snapshots, events
+
+    def append(self, draft_id, kind, data):
+        """Buffers an event. Returns how many events the draft has logged since its last snapshot."""
+        if self.replaying:
+            return 0
+        self.seq += 1
+        self.pending.append(('event', self.seq, draft_id, kind, json.dumps(data)))
+        if kind == 'end':
+            self.since_snapshot.pop(draft_id, None)
+            return 0
+        self.since_snapshot[draft_id] = self.since_snapshot.get(draft_id, 0) + 1
+        self._flush_if_full()
+        return self.since_snapshot[draft_id]
+
+    def snapshot(self, draft_id, state):
+        if self.replaying:
+            return
+        self.seq += 1
+        self.pending.append(('snapshot', self.seq, draft_id, None, json.dumps(state)))
+        self.since_snapshot[draft_id] = 0
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self.pending) >= FLUSH_BATCH and self.flusher is not None:
+            asyncio.ensure_future(self.flush())
+
+    def _write(self, batch):
+        with self.connection:
+            for entry, seq, draft_id, kind, payload in batch:
+                if entry == 'snapshot':
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO snapshots (draft_id, seq, state) VALUES (?, ?, ?)',
+                        (draft_id, seq, payload)
+                    )
+                    self.connection.execute('DELETE FROM events WHERE draft_id = ? AND seq < ?', (draft_id, seq))
+                elif kind == 'end':
+                    self.connection.execute('DELETE FROM snapshots WHERE draft_id = ?', (draft_id,))
+                    self.connection.execute('DELETE FROM events WHERE draft_id = ?', (draft_id,))
+                else:
+                    self.connection.execute(
+                        'INSERT INTO events (seq, draft_id, kind, data) VALUES (?, ?, ?, ?)',
+                        (seq, draft_id, kind, payload)
+                    )
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._write, batch)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except sqlite3.Error as error:
+                print('Failed to write draft state: {}'.format(error))
+
+    def start(self):
+        if self.flusher is None:
+            self.flusher = asyncio.ensure_future(self._flush_forever())
+
+    def close(self):
+        """Writes anything still buffered. Only for use once the event loop has stopped."""
+        batch, self.pending = self.pending, []
+        self._write(batch)
+        self.connection.close()
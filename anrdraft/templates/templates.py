@@ -1,214 +1,106 @@
 import json
-
-
-def identity_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Text*: {text}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        text=card.get('text', 'none')
-    )
-
-
-def agenda_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Agenda Points*: {agenda_points}\n'
-        '*Advancement Requirement*: {adv_req}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        agenda_points=card.get('agenda_points', 'none'),
-        adv_req=card.get('advancement_cost', 'none'),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def asset_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Rez Cost*: {rez_cost}\n'
-        '*Trash Cost*: {trash_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        rez_cost=str(card.get('cost', 'none')),
-        trash_cost=str(card.get('trash_cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def ice_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Rez Cost*: {rez_cost}\n'
-        '*Strength*: {strength}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        rez_cost=str(card.get('cost', 'none')),
-        strength=str(card.get('strength', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def operation_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Play Cost*: {play_cost}\n'
-        '*Trash Cost*: {trash_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        play_cost=str(card.get('cost', 'none')),
-        trash_cost=str(card.get('trash_cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def upgrade_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Rez Cost*: {rez_cost}\n'
-        '*Trash Cost*: {trash_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        rez_cost=str(card.get('cost', 'none')),
-        trash_cost=str(card.get('trash_cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def event_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Play Cost*: {play_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        play_cost=str(card.get('cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def hardware_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Install Cost*: {install_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        install_cost=str(card.get('cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def program_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Install Cost*: {install_cost}\n'
-        '*Memory*: {memory_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        install_cost=str(card.get('cost', 'none')),
-        memory_cost=str(card.get('memory_cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
-def resource_text(card):
-    return (
-        '*Name*: {name}\n'
-        '*Type*: {type}\n'
-        '*Subtype*: {subtype}\n'
-        '*Install Cost*: {install_cost}\n'
-        '*Text*: {text}\n'
-        '*Faction*: {faction}'
-    ).format(
-        name=card.get('title', 'none'),
-        type=card.get('type_code', 'none').title(),
-        subtype=card.get('keywords', 'none'),
-        install_cost=str(card.get('cost', 'none')),
-        text=card.get('text', 'none'),
-        faction=card.get('faction_code', 'none').title()
-    )
-
-
+from operator import attrgetter
+
+import metrics
+
+# Each card type is described by the lines it shows: (label, card field, transform).
+# Missing fields are shown as 'none', and fields listed as null (X values, see catalog.NULL) as 'None'.
+NAME = ('Name', 'title', None)
+TYPE = ('Type', 'type_code', str.title)
+SUBTYPE = ('Subtype', 'keywords', None)
+TEXT = ('Text', 'text', None)
+FACTION = ('Faction', 'faction_code', str.title)
+
+FIELD_SPECS = {
+    'identity': (
+        NAME, TYPE, TEXT
+    ),
+    'agenda': (
+        NAME, TYPE, SUBTYPE,
+        ('Agenda Points', 'agenda_points', None),
+        ('Advancement Requirement', 'advancement_cost', None),
+        TEXT, FACTION
+    ),
+    'asset': (
+        NAME, TYPE, SUBTYPE,
+        ('Rez Cost', 'cost', None),
+        ('Trash Cost', 'trash_cost', None),
+        TEXT, FACTION
+    ),
+    'ice': (
+        NAME, TYPE, SUBTYPE,
+        ('Rez Cost', 'cost', None),
+        ('Strength', 'strength', None),
+        TEXT, FACTION
+    ),
+    'operation': (
+        NAME, TYPE, SUBTYPE,
+        ('Play Cost', 'cost', None),
+        ('Trash Cost', 'trash_cost', None),
+        TEXT, FACTION
+    ),
+    'upgrade': (
+        NAME, TYPE, SUBTYPE,
+        ('Rez Cost', 'cost', None),
+        ('Trash Cost', 'trash_cost', None),
+        TEXT, FACTION
+    ),
+    'event': (
+        NAME, TYPE, SUBTYPE,
+        ('Play Cost', 'cost', None),
+        TEXT, FACTION
+    ),
+    'hardware': (
+        NAME, TYPE, SUBTYPE,
+        ('Install Cost', 'cost', None),
+        TEXT, FACTION
+    ),
+    'program': (
+        NAME, TYPE, SUBTYPE,
+        ('Install Cost', 'cost', None),
+        ('Memory', 'memory_cost', None),
+        TEXT, FACTION
+    ),
+    'resource': (
+        NAME, TYPE, SUBTYPE,
+        ('Install Cost', 'cost', None),
+        TEXT, FACTION
+    ),
+}
+
+
+def compile_renderer(spec):
+    """
+    Turns a field spec into a function that renders a card in one pass:
+    a single attrgetter pulls every field, then one str.format fills the template.
+    """
+    template = '\n'.join('*{label}*: {{}}'.format(label=label) for label, _, _ in spec)
+    fields = attrgetter(*(field for _, field, _ in spec))
+    transforms = tuple(transform for _, _, transform in spec)
+
+    def render(card):
+        values = [
+            'none' if value is None else (transform(value) if transform else value)
+            for value, transform in zip(fields(card), transforms)
+        ]
+        return template.format(*values)
+
+    return render
+
+
+def dump_text(card):
+    return '```' + json.dumps(card.as_dict(), indent=4, sort_keys=True) + '```'
+
+
+RENDERERS = {card_type: compile_renderer(spec) for card_type, spec in FIELD_SPECS.items()}
+
+
+@metrics.timed('format_card')
 def format(card):
-    card_type = card.get('type_code', 'none')
+    return RENDERERS.get(card.type_code, dump_text)(card)
+
 
-    if card_type == 'identity':
-        return identity_text(card)
-    elif card_type == 'agenda':
-        return agenda_text(card)
-    elif card_type == 'asset':
-        return asset_text(card)
-    elif card_type == 'ice':
-        return ice_text(card)
-    elif card_type == 'operation':
-        return operation_text(card)
-    elif card_type == 'upgrade':
-        return upgrade_text(card)
-    elif card_type == 'event':
-        return event_text(card)
-    elif card_type == 'hardware':
-        return hardware_text(card)
-    elif card_type == 'program':
-        return program_text(card)
-    elif card_type == 'resource':
-        return resource_text(card)
-    else:
-        return '```' + json.dumps(card, indent=4, sort_keys=True) + '```'
+def format_many(cards):
+    """Renders a whole pack in one call, returning the texts in the same order as the cards."""
+    renderers = RENDERERS
+    return [renderers.get(card.type_code, dump_text)(card) for card in cards]
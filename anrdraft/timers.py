@@ -0,0 +1,80 @@
+import asyncio
+import heapq
+import itertools
+import traceback
+
+
+class Scheduler:
+    """
+    Every pending timer in one heap, with a single loop callback armed for the earliest.
+    Timers are keyed, and scheduling a key again replaces its timer. Cancelled timers are
+    only marked, and dropped when they reach the top of the heap or the heap is compacted,
+    so scheduling and cancelling are O(log n) and O(1) however many timers are pending.
+    """
+
+    def __init__(self):
+        self.heap = []
+        # key -> [when, order, key, callback], callback is None once cancelled
+        self.timers = {}
+        self.order = itertools.count()
+        self.handle = None
+        self.handle_when = None
+
+    def __len__(self):
+        return len(self.timers)
+
+    def schedule(self, key, delay, callback):
+        """Calls callback, a coroutine function taking no arguments, in delay seconds."""
+        self.cancel(key)
+        loop = asyncio.get_running_loop()
+        entry = [loop.time() + delay, next(self.order), key, callback]
+        self.timers[key] = entry
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 2 * len(self.timers) + 64:
+            self._compact()
+        self._arm(loop)
+
+    def cancel(self, key):
+        entry = self.timers.pop(key, None)
+        if entry is not None:
+            entry[3] = None
+
+    def _compact(self):
+        self.heap = list(self.timers.values())
+        heapq.heapify(self.heap)
+
+    def _arm(self, loop):
+        heap = self.heap
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)
+        if not heap:
+            return
+        when = heap[0][0]
+        if self.handle is not None:
+            if self.handle_when <= when:
+                # already set to go off in time, it re-arms itself after
+                return
+            self.handle.cancel()
+        self.handle = loop.call_at(when, self._fire, loop)
+        self.handle_when = when
+
+    def _fire(self, loop):
+        self.handle = None
+        heap = self.heap
+        # the loop may call a little early, anything due within a millisecond counts as due
+        now = loop.time() + 0.001
+        while heap and heap[0][0] <= now:
+            when, order, key, callback = heapq.heappop(heap)
+            if callback is None:
+                continue
+            del self.timers[key]
+            asyncio.ensure_future(callback()).add_done_callback(_report_error)
+        self._arm(loop)
+
+
+def _report_error(task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        traceback.print_exception(type(error), error, error.__traceback__)
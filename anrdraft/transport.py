@@ -0,0 +1,136 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+
+class RateLimited(Exception):
+    """What the local transport raises in place of discord.py's HTTPException with status 429."""
+    status = 429
+
+    def __init__(self, retry_after):
+        super().__init__('429 Too Many Requests: retry after {:.2f}s'.format(retry_after))
+        self.retry_after = retry_after
+
+
+class DiscordTransport:
+    """Opens DM channels through a discord.py bot."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def cached_dm_channel(self, user_id):
+        """Returns the DM channel if discord.py already has it, without any HTTP."""
+        user = self.bot.get_user(user_id)
+        if user is None:
+            return None
+        return user.dm_channel
+
+    async def open_dm_channel(self, user_id):
+        user = self.bot.get_user(user_id)
+        if user is None:
+            # not in discord.py's cache, e.g. no shared guild since the bot started
+            user = await self.bot.fetch_user(user_id)
+        if user.dm_channel is not None:
+            return user.dm_channel
+        return await user.create_dm()
+
+
+class LocalChannel:
+    def __init__(self, transport, user_id):
+        self.transport = transport
+        self.user_id = user_id
+        self.messages = []
+        self.files = []
+        self.sent_at = deque()
+
+    async def send(self, content=None, embed=None, embeds=None, files=None):
+        await self.transport.send(self, content, embeds or ([embed] if embed else []), files or [])
+
+
+class LocalTransport:
+    """
+    In-process stand-in for Discord, for load tests.
+
+    Every message sent is recorded on the recipient's LocalChannel. Each request takes
+    latency seconds plus up to jitter more. A channel accepts rate_limit messages per
+    rate_window seconds and answers anything beyond that with a 429, and error_rate of
+    all sends fail with a 429 at random.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=None, rate_window=5.0, error_rate=0.0, rng=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate = error_rate
+        self.rng = rng or random.Random()
+        self.channels = {}
+        self.events = {}
+        self.replies = []
+        self.sent = 0
+        self.rate_limited = 0
+
+    def cached_dm_channel(self, user_id):
+        return self.channels.get(user_id)
+
+    async def open_dm_channel(self, user_id):
+        channel = self.channels.get(user_id)
+        if channel is None:
+            await self._wait()
+            channel = self.channels.setdefault(user_id, LocalChannel(self, user_id))
+        return channel
+
+    def message_event(self, user_id):
+        """An asyncio.Event set whenever a message is delivered to user_id. Clear it after waiting."""
+        event = self.events.get(user_id)
+        if event is None:
+            event = self.events[user_id] = asyncio.Event()
+        return event
+
+    async def _wait(self):
+        delay = self.latency + (self.rng.random() * self.jitter if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def send(self, channel, content, embeds, files=()):
+        await self._wait()
+        now = time.monotonic()
+
+        if self.rate_limit is not None:
+            window = channel.sent_at
+            while window and now - window[0] >= self.rate_window:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                self.rate_limited += 1
+                raise RateLimited(self.rate_window - (now - window[0]))
+            window.append(now)
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.rate_limited += 1
+            raise RateLimited(self.latency or 0.01)
+
+        channel.messages.append((content, embeds))
+        channel.files.extend(files)
+        self.sent += 1
+        self.message_event(channel.user_id).set()
+
+
+class LocalUser:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+
+
+class LocalContext:
+    """Enough of a discord.py Context to run the bot's commands: an author and replies."""
+
+    def __init__(self, transport, user_id, name):
+        self.transport = transport
+        self.author = LocalUser(user_id, name)
+
+    async def send(self, content=None, **kwargs):
+        self.transport.replies.append((self.author.id, content))
+
+    async def send_help(self, *args):
+        pass